@@ -0,0 +1,169 @@
+import json
+import os
+import pygame
+from concurrent.futures import ThreadPoolExecutor
+
+
+def pack_shelves(sizes, page_size, padding=1):
+    # Shelf packing, tallest first. Returns (page, x, y) for every size, in the order given.
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    placements = [None] * len(sizes)
+    page, x, y, shelf_height = 0, 0, 0, 0
+    for i in order:
+        width, height = sizes[i][0] + padding, sizes[i][1] + padding
+        if width > page_size or height > page_size:
+            raise ValueError("texture of size %dx%d doesn't fit a %d atlas page" % (*sizes[i], page_size))
+        if x + width > page_size:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        if y + height > page_size:
+            page, x, y, shelf_height = page + 1, 0, 0, 0
+        placements[i] = (page, x, y)
+        x += width
+        shelf_height = max(shelf_height, height)
+    return placements
+
+
+class AtlasGroup:
+    def __init__(self, pages, regions):
+        self.pages = pages
+        # key -> (page index, pygame.Rect)
+        self.regions = regions
+        self.surfaces = {key: pages[page].subsurface(rect) for key, (page, rect) in regions.items()}
+
+
+class TextureStore:
+    # Textures are grouped by their top-level directory (other, modifiers, tiles, ...) and every
+    # group is packed into atlas pages. Packed pages and their region index are cached on disk and
+    # reused while the source files are unchanged. Critical groups load at startup, the rest on the
+    # first get() of one of their keys, or earlier in the background through prefetch().
+    def __init__(self, directory, cache_directory, critical=("other",), page_size=2048, workers=4):
+        self.directory = directory
+        self.cache_directory = cache_directory
+        self.page_size = page_size
+        self.executor = ThreadPoolExecutor(workers)
+        self.groups = {}
+        self.pending = {}
+        self.sources = self.scan()
+        self.empty = pygame.Surface((32, 32))
+        self.empty.fill((0, 0, 0))
+        for group in critical:
+            if group in self.sources:
+                self.load_group(group)
+
+    def scan(self):
+        sources = {}
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith('.png'):
+                    file_path = os.path.join(root, file)
+                    relative_path = os.path.relpath(file_path, self.directory)
+                    relative_path = relative_path.replace(os.path.sep, '.')
+                    texture_key = os.path.splitext(relative_path)[0]
+                    sources.setdefault(self.group_of(texture_key), {})[texture_key] = file_path
+        return sources
+
+    @staticmethod
+    def group_of(key):
+        return key.split('.')[0] if '.' in key else ""
+
+    def signature(self, group):
+        signature = {}
+        for key, path in self.sources[group].items():
+            stat = os.stat(path)
+            signature[key] = [stat.st_mtime_ns, stat.st_size]
+        return signature
+
+    def index_path(self, group):
+        return os.path.join(self.cache_directory, "%s.json" % (group or "_root"))
+
+    def page_path(self, group, page):
+        return os.path.join(self.cache_directory, "%s.%d.png" % (group or "_root", page))
+
+    def read_cache(self, group):
+        try:
+            with open(self.index_path(group), 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if index.get("page_size") != self.page_size or index.get("sources") != self.signature(group):
+            return None
+        return index
+
+    def prefetch(self, group):
+        # Starts decoding a group's files (or its cached pages) on the worker threads. Surfaces are
+        # converted on the main thread in load_group, which waits for whatever is still decoding.
+        if group not in self.sources or group in self.groups or group in self.pending:
+            return
+        index = self.read_cache(group)
+        if index is not None:
+            paths = [self.page_path(group, page) for page in range(index["pages"])]
+        else:
+            paths = list(self.sources[group].values())
+        self.pending[group] = (index, [self.executor.submit(pygame.image.load, path) for path in paths])
+
+    def load_group(self, group):
+        self.prefetch(group)
+        index, futures = self.pending.pop(group)
+        surfaces = [future.result().convert_alpha() for future in futures]
+        if index is not None:
+            regions = {key: (page, pygame.Rect(rect)) for key, (page, *rect) in index["regions"].items()}
+            self.groups[group] = AtlasGroup(surfaces, regions)
+        else:
+            self.groups[group] = self.pack(group, list(self.sources[group].keys()), surfaces)
+        return self.groups[group]
+
+    def pack(self, group, keys, surfaces):
+        placements = pack_shelves([surface.get_size() for surface in surfaces], self.page_size)
+        # pages are cut down to what was actually used, small groups don't need a full page
+        extents = [[1, 1] for _ in range(max(page for page, _, _ in placements) + 1)]
+        for surface, (page, x, y) in zip(surfaces, placements):
+            extents[page][0] = max(extents[page][0], x + surface.get_width())
+            extents[page][1] = max(extents[page][1], y + surface.get_height())
+        pages = [pygame.Surface(extent, pygame.SRCALPHA) for extent in extents]
+        regions = {}
+        for key, surface, (page, x, y) in zip(keys, surfaces, placements):
+            pages[page].fill((0, 0, 0, 0), (x, y, surface.get_width(), surface.get_height()))
+            pages[page].blit(surface, (x, y), special_flags=pygame.BLEND_RGBA_MAX)
+            regions[key] = (page, pygame.Rect(x, y, *surface.get_size()))
+        self.write_cache(group, pages, regions)
+        return AtlasGroup(pages, regions)
+
+    def write_cache(self, group, pages, regions):
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            for i, page in enumerate(pages):
+                pygame.image.save(page, self.page_path(group, i))
+            with open(self.index_path(group), 'w') as file:
+                json.dump({
+                    "page_size": self.page_size,
+                    "pages": len(pages),
+                    "sources": self.signature(group),
+                    "regions": {key: [page, *rect] for key, (page, rect) in regions.items()}
+                }, file)
+        except OSError:
+            # a read-only install just repacks on every start
+            pass
+
+    def group(self, key):
+        group = self.group_of(key)
+        if group not in self.sources or key not in self.sources[group]:
+            return None
+        if group not in self.groups:
+            self.load_group(group)
+        return self.groups[group]
+
+    def get(self, key):
+        if key == '__empty__':
+            return self.empty
+        group = self.group(key)
+        if group is None:
+            return self.empty
+        return group.surfaces[key]
+
+    def region(self, key):
+        # (page surface, rect) for drawing straight from the atlas
+        group = self.group(key)
+        if group is None:
+            return None
+        page, rect = group.regions[key]
+        return group.pages[page], rect
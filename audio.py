@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import pygame
+
+sound_extensions = ('.ogg', '.wav', '.mp3', '.flac')
+
+
+class AudioMixer:
+    # Sound effects are decoded once into pygame Sounds and played on a fixed pool of channels, so a
+    # burst of shots never allocates anything. When every channel is busy the quietest-priority,
+    # oldest voice is cut for a new sound of at least its priority, otherwise the new sound is
+    # dropped; a single sound never holds more than `voices_per_sound` channels. Music is streamed
+    # from disk by pygame.mixer.music. SDL mixes everything on its own audio thread.
+    # Without an audio device the mixer stays disabled and every call does nothing.
+    def __init__(self, sound_directory, music_directory, channels=24, voices_per_sound=4):
+        self.sound_directory = sound_directory
+        self.music_directory = music_directory
+        self.voices_per_sound = voices_per_sound
+        self.sounds = {}
+        self.sound_volume = 1.0
+        self.music = None
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            pygame.mixer.set_num_channels(channels)
+            self.enabled = True
+        except pygame.error:
+            self.enabled = False
+            channels = 0
+        self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        # per channel: (priority, start time, sound key), None when free
+        self.voices = [None] * channels
+
+    def scan(self, directory):
+        # key -> path, keys like the texture keys: sounds/weapons/laser.ogg -> weapons.laser
+        files = {}
+        if os.path.isdir(directory):
+            for root, _, names in os.walk(directory):
+                for name in names:
+                    if name.endswith(sound_extensions):
+                        path = os.path.join(root, name)
+                        key = os.path.splitext(os.path.relpath(path, directory).replace(os.path.sep, '.'))[0]
+                        files[key] = path
+        return files
+
+    def load_sounds(self):
+        if not self.enabled:
+            return
+        for key, path in self.scan(self.sound_directory).items():
+            try:
+                self.sounds[key] = pygame.mixer.Sound(path)
+            except pygame.error:
+                print("can't load sound %s" % path)
+
+    def set_volumes(self, settings):
+        # settings are 0..200 with 200 at full scale
+        self.sound_volume = min(max(settings["sound"] / 200, 0.0), 1.0)
+        if self.enabled:
+            pygame.mixer.music.set_volume(min(max(settings["music"] / 200, 0.0), 1.0))
+
+    def channel_for(self, key, priority):
+        now = time.perf_counter()
+        same, free, victim = [], None, None
+        for i, channel in enumerate(self.channels):
+            voice = self.voices[i]
+            if voice is None or not channel.get_busy():
+                self.voices[i] = None
+                if free is None:
+                    free = i
+                continue
+            if voice[2] == key:
+                same.append(i)
+            if victim is None or voice[:2] < self.voices[victim][:2]:
+                victim = i
+        if len(same) >= self.voices_per_sound:
+            # restart the oldest copy instead of stacking more of the same sound
+            return min(same, key=lambda i: self.voices[i][1]), now
+        if free is not None:
+            return free, now
+        if victim is not None and self.voices[victim][0] <= priority:
+            return victim, now
+        return None, now
+
+    def play(self, key, priority=0, volume=1.0):
+        # Returns False when the sound doesn't exist or was dropped for higher-priority voices
+        sound = self.sounds.get(key)
+        if sound is None:
+            return False
+        i, now = self.channel_for(key, priority)
+        if i is None:
+            return False
+        channel = self.channels[i]
+        channel.stop()
+        channel.set_volume(volume * self.sound_volume)
+        channel.play(sound)
+        self.voices[i] = (priority, now, key)
+        return True
+
+    def play_music(self, key, loops=-1, fade_ms=500):
+        if not self.enabled or key == self.music:
+            return
+        path = self.scan(self.music_directory).get(key)
+        if path is None:
+            return
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.play(loops, fade_ms=fade_ms)
+        self.music = key
+
+    def stop_music(self, fade_ms=500):
+        if self.enabled:
+            pygame.mixer.music.fadeout(fade_ms)
+        self.music = None
+
+    def close(self):
+        if self.enabled:
+            pygame.mixer.music.stop()
+            pygame.mixer.stop()
+
+
+if __name__ == "__main__":
+    # Weapon fire burst on the dummy driver: cost of play() with every channel busy
+    #   python audio.py [shots]
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.pre_init(44100, -16, 2, 512)
+    pygame.init()
+    mixer = AudioMixer("sounds", "music")
+    mixer.sounds = {"shot.%d" % i: pygame.mixer.Sound(buffer=bytes(44100 * 4)) for i in range(8)}
+    shots = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    start = time.perf_counter()
+    played = sum(mixer.play("shot.%d" % (i % 8), priority=i % 3) for i in range(shots))
+    elapsed = time.perf_counter() - start
+    print("%d shots, %d played, %.2f us per play(), %d channels busy" % (
+        shots, played, elapsed / shots * 1e6, sum(channel.get_busy() for channel in mixer.channels)))
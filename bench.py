@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import sys
+import time
+import pygame
+import numpy as np
+from graphics import (FramePresenter, ParticleSystem, PostProcess, SpriteBatch, TileMapRenderer,
+                      create_headless_context)
+from tilemap import TileMap
+
+# Runs render pipeline pieces for a fixed number of frames on a standalone GL context, so it works
+# on machines without a display (llvmpipe/osmesa on CPU-only Linux included).
+#   python bench.py --frames 300 --sizes 640x360,1200x600,1920x1080 --json bench.json
+
+post_configs = {
+    "fused_only": {"bloom": False, "chromatic_aberration": False, "other_distortion_effects": False},
+    "all_effects": {"bloom": False, "chromatic_aberration": True, "other_distortion_effects": True},
+    "bloom_low": {"bloom": True, "bloom_quality": "low"},
+    "bloom_medium": {"bloom": True, "bloom_quality": "medium"},
+    "bloom_high": {"bloom": True, "bloom_quality": "high"}
+}
+
+
+def post_settings(overrides):
+    settings = {"bloom": True, "bloom_quality": "medium", "chromatic_aberration": False,
+                "other_distortion_effects": False, "screen_shake": 1.0}
+    settings.update(overrides)
+    return settings
+
+
+def measure(frames, frame, finish=None):
+    # one warmup frame so shader compilation and first uploads don't land in the numbers
+    frame(0)
+    if finish is not None:
+        finish()
+    times = []
+    start = time.perf_counter()
+    for i in range(frames):
+        frame_start = time.perf_counter()
+        frame(i)
+        if finish is not None:
+            finish()
+        times.append((time.perf_counter() - frame_start) * 1000)
+    total = time.perf_counter() - start
+    times.sort()
+    return {
+        "frames": frames,
+        "fps": frames / total,
+        "mean_ms": sum(times) / frames,
+        "p50_ms": times[frames // 2],
+        "p95_ms": times[min(frames - 1, int(frames * 0.95))],
+        "p99_ms": times[min(frames - 1, int(frames * 0.99))]
+    }
+
+
+def menu_like_surface(size):
+    surface = pygame.Surface(size)
+    surface.fill((10, 10, 10))
+    return surface
+
+
+def bench_upload(ctx, size, frames, full):
+    surface = menu_like_surface(size)
+    presenter = FramePresenter(ctx, surface)
+    rows = [pygame.Rect(130, 150 + i * 30, 670, 24) for i in range(10)]
+
+    def frame(i):
+        surface.fill((10, 10, 10))
+        for rect in rows:
+            presenter.blit(pygame.Surface(rect.size), rect.topleft)
+        if full:
+            presenter.invalidate()
+        presenter.present()
+
+    result = measure(frames, frame, ctx.finish)
+    presenter.texture.release()
+    return result
+
+
+def bench_post(ctx, size, frames, overrides):
+    source = ctx.texture(size, 4)
+    target_texture = ctx.texture(size, 4)
+    target = ctx.framebuffer(color_attachments=[target_texture])
+    post_process = PostProcess(ctx, size)
+    post_process.build(post_settings(overrides))
+
+    result = measure(frames, lambda i: post_process.render(source, target), ctx.finish)
+    post_process.release()
+    target.release()
+    target_texture.release()
+    source.release()
+    return result
+
+
+class GeneratedAtlas:
+    # Stand-in for TextureStore.region so sprite benchmarks don't depend on the texture directory
+    def __init__(self):
+        self.page = pygame.Surface((64, 64), pygame.SRCALPHA)
+        self.page.fill((255, 200, 80, 255))
+
+    def region(self, key):
+        return self.page, pygame.Rect(0, 0, 16, 16)
+
+
+def bench_sprites(ctx, size, frames, count):
+    sprites = SpriteBatch(ctx, GeneratedAtlas(), size)
+    positions = (np.random.rand(count, 2) * size).astype('f4')
+    rotations = np.random.rand(count).astype('f4') * 6.28
+
+    def frame(i):
+        sprites.draw_many("sprite", positions, rotations)
+        sprites.render()
+
+    return measure(frames, frame, ctx.finish)
+
+
+def bench_tilemap(ctx, size, frames, static):
+    # 2048x2048 tiles, scrolling diagonally; `static` = False also changes a tile on screen every frame
+    tiles = {tile: "tiles.%d" % tile for tile in range(1, 18)}
+    tile_map = TileMap.from_array(np.random.randint(0, 18, (2048, 2048)).astype(np.uint8))
+    renderer = TileMapRenderer(ctx, GeneratedAtlas(), tiles, size)
+    renderer.set_map(tile_map)
+    sprites = SpriteBatch(ctx, GeneratedAtlas(), size)
+
+    def frame(i):
+        renderer.camera = (i * 3.0, i * 2.0)
+        if not static:
+            tile_map.set(int(renderer.camera[0]) // 32 + 5, int(renderer.camera[1]) // 32 + 5, i % 18)
+        sprites.render(renderer)
+
+    result = measure(frames, frame, ctx.finish)
+    renderer.release_chunks()
+    return result
+
+
+def bench_particles(ctx, size, frames, count):
+    # Keeps about `count` particles alive: 200 engine trails plus explosions topping it up
+    particles = ParticleSystem(ctx, size, max(65536, count))
+    sprites = SpriteBatch(ctx, GeneratedAtlas(), size)
+    ships = np.random.uniform(0, 1, (200, 2)) * size
+    angles = np.random.uniform(0, 6.283, 200)
+    burst = max(count // 60, 1)
+
+    def frame(i):
+        particles.emit_many("engine", ships, angles, 1 / 60)
+        particles.emit("explosion", *ships[i % len(ships)], count=burst)
+        particles.update(1 / 60)
+        sprites.render(None, particles)
+
+    for i in range(60):
+        frame(i)
+    result = measure(frames, frame, ctx.finish)
+    particles.release()
+    return result
+
+
+def bench_menu(frames):
+    os.environ["BYTED_HEADLESS"] = "1"
+    import main
+    target_texture = main.ctx.texture(main.display.get_size(), 4)
+    target = main.ctx.framebuffer(color_attachments=[target_texture])
+    results = {}
+
+    def render(i):
+        main.menu.update()
+        main.menu.render()
+
+    def redraw(i):
+        main.menu.dirty = True
+        render(i)
+
+    def render_and_upload(i):
+        render(i)
+        main.presenter.present()
+
+    def full_frame(i):
+        render_and_upload(i)
+        main.post_process.render(main.presenter.texture, target)
+
+    results["menu.render"] = measure(frames, render)
+    results["menu.redraw"] = measure(frames, redraw)
+    results["menu.render+upload"] = measure(frames, render_and_upload, main.ctx.finish)
+    results["menu.full_frame"] = measure(frames, full_frame, main.ctx.finish)
+    return results
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def run(args):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    if args.backend:
+        os.environ["BYTED_GL_BACKEND"] = args.backend
+    pygame.init()
+    pygame.display.set_mode((1, 1))
+    ctx = create_headless_context(args.backend)
+    results = []
+
+    for size in map(parse_size, args.sizes.split(",")):
+        label = "%dx%d" % size
+        results.append(dict(name="upload.full", size=label, **bench_upload(ctx, size, args.frames, True)))
+        results.append(dict(name="upload.dirty", size=label, **bench_upload(ctx, size, args.frames, False)))
+        for name, overrides in post_configs.items():
+            results.append(dict(name="post." + name, size=label, **bench_post(ctx, size, args.frames, overrides)))
+        results.append(dict(name="tilemap.static", size=label, **bench_tilemap(ctx, size, args.frames, True)))
+        results.append(dict(name="tilemap.editing", size=label, **bench_tilemap(ctx, size, args.frames, False)))
+        for count in (10000, 50000):
+            results.append(dict(name="particles.%d" % count, size=label,
+                                **bench_particles(ctx, size, args.frames, count)))
+        for count in (1000, 10000):
+            results.append(dict(name="sprites.%d" % count, size=label,
+                                **bench_sprites(ctx, size, args.frames, count)))
+
+    if not args.skip_menu:
+        for name, result in bench_menu(args.frames).items():
+            results.append(dict(name=name, size="1200x600", **result))
+
+    print("%-24s %-10s %9s %9s %9s %9s %9s" % ("benchmark", "size", "fps", "mean ms", "p50 ms", "p95 ms", "p99 ms"))
+    for result in results:
+        print("%-24s %-10s %9.1f %9.3f %9.3f %9.3f %9.3f" % (result["name"], result["size"], result["fps"],
+                                                            result["mean_ms"], result["p50_ms"], result["p95_ms"],
+                                                            result["p99_ms"]))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"renderer": ctx.info["GL_RENDERER"], "results": results}, file, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless render pipeline benchmarks")
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--sizes", default="640x360,1200x600,1920x1080")
+    parser.add_argument("--backend", default=None, help="moderngl standalone backend, e.g. egl")
+    parser.add_argument("--skip-menu", action="store_true", help="don't import main for the menu benchmarks")
+    parser.add_argument("--json", default=None, help="also write the results to this file")
+    run(parser.parse_args(sys.argv[1:]))
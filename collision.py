@@ -0,0 +1,198 @@
+import argparse
+import math
+import sys
+import time
+import numba
+import numpy as np
+from spatial import SpatialGrid
+from world import World, KIND_SHIP, KIND_PROJECTILE
+
+
+@numba.njit(cache=True)
+def segment_circle(ax, ay, bx, by, cx, cy, r):
+    # First t in 0..1 where the segment a->b is within r of c, -1 if never. A circle moving along a
+    # segment against a point is the same test as a capsule against a circle, so fast projectiles
+    # can't tunnel through ships between ticks.
+    dx = bx - ax
+    dy = by - ay
+    fx = ax - cx
+    fy = ay - cy
+    c = fx * fx + fy * fy - r * r
+    if c <= 0:
+        return 0.0
+    a = dx * dx + dy * dy
+    if a == 0:
+        return -1.0
+    b = fx * dx + fy * dy
+    discriminant = b * b - a * c
+    if discriminant < 0:
+        return -1.0
+    t = (-b - math.sqrt(discriminant)) / a
+    if 0 <= t <= 1:
+        return t
+    return -1.0
+
+
+@numba.njit(cache=True)
+def first_hit(ax, ay, bx, by, reach, skip, position, radius, cell_start, cell_entities, cell_size, columns, rows,
+              max_radius):
+    # Closest target hit by a segment with half width `reach`, only checking the grid cells its
+    # bounding box overlaps. Returns (slot, t) or (-1, 2.0).
+    margin = reach + max_radius
+    first_column = min(max(int((min(ax, bx) - margin) / cell_size), 0), columns - 1)
+    last_column = min(max(int((max(ax, bx) + margin) / cell_size), 0), columns - 1)
+    first_row = min(max(int((min(ay, by) - margin) / cell_size), 0), rows - 1)
+    last_row = min(max(int((max(ay, by) + margin) / cell_size), 0), rows - 1)
+    best = -1
+    best_t = 2.0
+    for row in range(first_row, last_row + 1):
+        for column in range(first_column, last_column + 1):
+            c = row * columns + column
+            for k in range(cell_start[c], cell_start[c + 1]):
+                target = cell_entities[k]
+                if target == skip:
+                    continue
+                t = segment_circle(ax, ay, bx, by, position[target, 0], position[target, 1], radius[target] + reach)
+                if 0 <= t < best_t:
+                    best = target
+                    best_t = t
+    return best, best_t
+
+
+@numba.njit(cache=True)
+def projectile_hits(projectiles, previous, position, radius, owner, cell_start, cell_entities, cell_size, columns,
+                    rows, max_radius):
+    # (projectile, ship) for every projectile that hit a ship this tick, swept from its previous position
+    hits = np.empty((projectiles.shape[0], 2), dtype=np.int64)
+    n = 0
+    for k in range(projectiles.shape[0]):
+        p = projectiles[k]
+        target, t = first_hit(previous[p, 0], previous[p, 1], position[p, 0], position[p, 1], radius[p], owner[p],
+                              position, radius, cell_start, cell_entities, cell_size, columns, rows, max_radius)
+        if target >= 0:
+            hits[n, 0] = p
+            hits[n, 1] = target
+            n += 1
+    return hits[:n]
+
+
+@numba.njit(cache=True)
+def laser_hits(origins, angles, lengths, widths, owners, position, radius, cell_start, cell_entities, cell_size,
+               columns, rows, max_radius):
+    # Beams stop at the first ship they touch: ship slot (-1 for none) and distance travelled per beam
+    targets = np.full(origins.shape[0], -1, dtype=np.int64)
+    distances = lengths.astype(np.float64).copy()
+    for i in range(origins.shape[0]):
+        ax = origins[i, 0]
+        ay = origins[i, 1]
+        bx = ax + math.cos(angles[i]) * lengths[i]
+        by = ay + math.sin(angles[i]) * lengths[i]
+        target, t = first_hit(ax, ay, bx, by, widths[i] / 2, owners[i], position, radius, cell_start, cell_entities,
+                              cell_size, columns, rows, max_radius)
+        if target >= 0:
+            targets[i] = target
+            distances[i] = t * lengths[i]
+    return targets, distances
+
+
+@numba.njit(cache=True)
+def all_pairs_projectile_hits(projectiles, ships, previous, position, radius, owner):
+    # Reference for the benchmark, O(projectiles * ships)
+    hits = np.empty((projectiles.shape[0], 2), dtype=np.int64)
+    n = 0
+    for k in range(projectiles.shape[0]):
+        p = projectiles[k]
+        best = -1
+        best_t = 2.0
+        for s in ships:
+            if s == owner[p]:
+                continue
+            t = segment_circle(previous[p, 0], previous[p, 1], position[p, 0], position[p, 1], position[s, 0],
+                               position[s, 1], radius[s] + radius[p])
+            if 0 <= t < best_t:
+                best = s
+                best_t = t
+        if best >= 0:
+            hits[n, 0] = p
+            hits[n, 1] = best
+            n += 1
+    return hits[:n]
+
+
+class CollisionSystem:
+    # Ships go into a uniform grid once per tick (broad phase), projectiles and laser beams then
+    # only test the ships in the cells their swept path overlaps (narrow phase).
+    def __init__(self, width, height, cell_size=128.0):
+        self.grid = SpatialGrid(width, height, cell_size)
+        self.max_radius = 0.0
+
+    def update(self, world):
+        active = world.active()
+        ships = active[world.kind[active] == KIND_SHIP]
+        self.max_radius = float(world.radius[ships].max()) if len(ships) else 0.0
+        self.grid.build(world.position, ships)
+        return active
+
+    def projectiles(self, world, active=None):
+        if active is None:
+            active = world.active()
+        projectiles = active[world.kind[active] == KIND_PROJECTILE]
+        grid = self.grid
+        return projectile_hits(projectiles, world.previous, world.position, world.radius, world.owner,
+                               grid.cell_start, grid.cell_entities, grid.cell_size, grid.columns, grid.rows,
+                               self.max_radius)
+
+    def lasers(self, world, origins, angles, lengths, widths, owners):
+        grid = self.grid
+        return laser_hits(np.asarray(origins, dtype=np.float64), np.asarray(angles, dtype=np.float64),
+                          np.asarray(lengths, dtype=np.float64), np.asarray(widths, dtype=np.float64),
+                          np.asarray(owners, dtype=np.int64), world.position, world.radius, grid.cell_start,
+                          grid.cell_entities, grid.cell_size, grid.columns, grid.rows, self.max_radius)
+
+
+def benchmark(ships, counts, ticks, naive):
+    # python collision.py --ships 1000 --projectiles 1000,10000,50000
+    size = 8192.0
+    random = np.random.default_rng(0)
+    print("%-12s %-8s %12s %12s %8s" % ("projectiles", "ships", "grid ms", "all-pairs ms", "hits"))
+    for count in counts:
+        world = World(ships + count, size, size)
+        for _ in range(ships):
+            world.spawn(KIND_SHIP, *(random.random(2) * size))
+        for _ in range(count):
+            p = world.spawn(KIND_PROJECTILE, *(random.random(2) * size))
+            world.velocity[p] = (random.random(2) - 0.5) * 2 * 1200
+            world.lifetime[p] = 1e9
+        collisions = CollisionSystem(size, size)
+        world.step(1 / 60)
+        collisions.projectiles(world, collisions.update(world))
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            hits = collisions.projectiles(world, collisions.update(world))
+        grid_ms = (time.perf_counter() - start) / ticks * 1000
+
+        naive_ms = float("nan")
+        if naive:
+            active = world.active()
+            projectiles = active[world.kind[active] == KIND_PROJECTILE]
+            ship_slots = active[world.kind[active] == KIND_SHIP]
+            reference = all_pairs_projectile_hits(projectiles, ship_slots, world.previous, world.position,
+                                                  world.radius, world.owner)
+            start = time.perf_counter()
+            for _ in range(ticks):
+                all_pairs_projectile_hits(projectiles, ship_slots, world.previous, world.position, world.radius,
+                                          world.owner)
+            naive_ms = (time.perf_counter() - start) / ticks * 1000
+            assert sorted(map(tuple, hits.tolist())) == sorted(map(tuple, reference.tolist()))
+        print("%-12d %-8d %12.3f %12.3f %8d" % (count, ships, grid_ms, naive_ms, len(hits)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collision broad/narrow phase benchmark")
+    parser.add_argument("--ships", type=int, default=1000)
+    parser.add_argument("--projectiles", default="1000,10000,50000")
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--naive", action="store_true", help="also time (and cross-check) the all-pairs version")
+    args = parser.parse_args(sys.argv[1:])
+    benchmark(args.ships, [int(count) for count in args.projectiles.split(",")], args.ticks, args.naive)
@@ -0,0 +1,299 @@
+# Game data shared by the client (main.py) and the headless server (server.py), no pygame here
+
+tiles = {
+    1: "tiles.",
+    2: "tiles.",
+    3: "tiles.",
+    4: "tiles.",
+    5: "tiles.",
+    6: "tiles.",
+    7: "tiles.",
+    8: "tiles.",
+    9: "tiles.",
+    10: "tiles.",
+    11: "tiles.",
+    12: "tiles.",
+    13: "tiles.",
+    14: "tiles.",
+    15: "tiles.",
+    16: "tiles.",
+    17: "tiles."
+}
+
+# Stats of a ship without modifiers, flags are 1 (on) / 0 (off)
+ship_stats = {
+    "shield": 100,
+    "health": 100,
+    "shield_regeneration": 1,
+    "health_regeneration": 0,
+    "move_speed": 200,
+    "rotation_speed": 3.0,
+    "attack_speed": 2.0,
+    "damage": 10,
+    "damage_gain": 1.0,
+    "energy_usage": 1.0,
+    "projectile_speed": 600,
+    "heating": 1.0,
+    "overheat_duration": 2.0,
+    "laser_width": 4,
+    "can_shoot_while_rotating": 1
+}
+
+modifiers = {
+    # Negative modifiers
+    "low_shield": {
+        "name": "modifier.low_shield",
+        "description": "modifier.low_shield.description",
+        "texture": "modifiers.low_shield",
+        "incompatible": ["high_shield"],
+        "action": "mul",
+        "effects": {
+            "shield": 0.5
+        },
+        "DP": -3
+    },
+    "low_health": {
+        "name": "modifier.low_health",
+        "description": "modifier.low_health.description",
+        "texture": "modifiers.low_health",
+        "incompatible": ["high_health"],
+        "action": "mul",
+        "effects": {
+            "health": 0.5
+        },
+        "DP": -3
+    },
+    "low_mobility": {
+        "name": "modifier.low_mobility",
+        "description": "modifier.low_mobility.description",
+        "texture": "modifiers.low_mobility",
+        "incompatible": ["high_mobility"],
+        "action": "mul",
+        "effects": {
+            "move_speed": 0.6,
+            "rotation_speed": 0.6
+        },
+        "DP": -3
+    },
+    "low_attack_speed": {
+        "name": "modifier.low_attack_speed",
+        "description": "modifier.low_attack_speed.description",
+        "texture": "modifiers.low_attack_speed",
+        "incompatible": ["high_attack_speed"],
+        "action": "mul",
+        "effects": {
+            "attack_speed": 0.6
+        },
+        "DP": -3
+    },
+    "low_damage": {
+        "name": "modifier.low_damage",
+        "description": "modifier.low_damage.description",
+        "texture": "modifiers.low_damage",
+        "incompatible": ["high_damage"],
+        "action": "mul",
+        "effects": {
+            "damage": 0.6
+        },
+        "DP": -3
+    },
+    "high_energy_usage": {
+        "name": "modifier.high_energy_usage",
+        "description": "modifier.high_energy_usage.description",
+        "texture": "modifiers.high_energy_usage",
+        "incompatible": ["low_energy_usage"],
+        "action": "mul",
+        "effects": {
+            "energy_usage": 1.5
+        },
+        "DP": -2
+    },
+    "low_projectile_speed": {
+        "name": "modifier.low_projectile_speed",
+        "description": "modifier.low_projectile_speed.description",
+        "texture": "modifiers.low_projectile_speed",
+        "incompatible": ["high_projectile_speed"],
+        "action": "mul",
+        "effects": {
+            "projectile_speed": 0.5
+        },
+        "DP": -2
+    },
+    "high_heating": {
+        "name": "modifier.high_heating",
+        "description": "modifier.high_heating.description",
+        "texture": "modifiers.high_heating",
+        "incompatible": ["low_heating"],
+        "action": "mul",
+        "effects": {
+            "heating": 1.5
+        },
+        "DP": -1
+    },
+    "low_laser_width": {
+        "name": "modifier.low_laser_width",
+        "description": "modifier.low_laser_width.description",
+        "texture": "modifiers.low_laser_width",
+        "incompatible": ["high_laser_width"],
+        "action": "mul",
+        "effects": {
+            "laser_width": 0.7
+        },
+        "DP": -1
+    },
+    # Unstable
+    "glass_cannon": {
+        "name": "modifier.glass_cannon",
+        "description": "modifier.glass_cannon.description",
+        "texture": "modifiers.glass_cannon",
+        "incompatible": [],
+        "unstable": True,
+        "action": "mul",
+        "effects": {
+            "damage": 2,
+            "damage_gain": 2
+        },
+        "DP": 0
+    },
+    "regeneration_swap": {
+        "name": "modifier.regeneration_swap",
+        "description": "modifier.regeneration_swap.description",
+        "texture": "modifiers.regeneration_swap",
+        "incompatible": [],
+        "unstable": True,
+        "action": "set",
+        "effects": {
+            "shield_regeneration": 0,
+            "health_regeneration": 1
+        },
+        "DP": 0
+    },
+    "acceleration": {
+        "name": "modifier.acceleration",
+        "description": "modifier.acceleration.description",
+        "texture": "modifiers.acceleration",
+        "incompatible": [],
+        "unstable": True,
+        "action": "mul",
+        "effects": {
+            "can_shoot_while_rotating": 0,
+            "move_speed": 1.5
+        },
+        "DP": 0
+    },
+    "overclock": {
+        "name": "modifier.overclock",
+        "description": "modifier.overclock.description",
+        "texture": "modifiers.overclock",
+        "incompatible": [],
+        "unstable": True,
+        "action": "mul",
+        "effects": {
+            "heating": 3,
+            "overheat_duration": 1.5,
+            "attack_speed": 1.5
+        },
+        "DP": 0
+    },
+    # Positive modifiers
+    "high_shield": {
+        "name": "modifier.high_shield",
+        "description": "modifier.high_shield.description",
+        "texture": "modifiers.high_shield",
+        "incompatible": ["low_shield"],
+        "action": "mul",
+        "effects": {
+            "shield": 1.8
+        },
+        "DP": 3
+    },
+    "high_health": {
+        "name": "modifier.high_health",
+        "description": "modifier.high_health.description",
+        "texture": "modifiers.high_health",
+        "incompatible": ["low_health"],
+        "action": "mul",
+        "effects": {
+            "health": 1.8
+        },
+        "DP": 3
+    },
+    "high_mobility": {
+        "name": "modifier.high_mobility",
+        "description": "modifier.high_mobility.description",
+        "texture": "modifiers.high_mobility",
+        "incompatible": ["low_mobility"],
+        "action": "mul",
+        "effects": {
+            "move_speed": 1.5,
+            "rotation_speed": 1.5
+        },
+        "DP": 3
+    },
+    "high_attack_speed": {
+        "name": "modifier.high_attack_speed",
+        "description": "modifier.high_attack_speed.description",
+        "texture": "modifiers.high_attack_speed",
+        "incompatible": ["low_attack_speed"],
+        "action": "mul",
+        "effects": {
+            "attack_speed": 1.5
+        },
+        "DP": 3
+    },
+    "high_damage": {
+        "name": "modifier.high_damage",
+        "description": "modifier.high_damage.description",
+        "texture": "modifiers.high_damage",
+        "incompatible": ["low_damage"],
+        "action": "mul",
+        "effects": {
+            "damage": 1.5
+        },
+        "DP": 3
+    },
+    "low_energy_usage": {
+        "name": "modifier.low_energy_usage",
+        "description": "modifier.low_energy_usage.description",
+        "texture": "modifiers.low_energy_usage",
+        "incompatible": ["high_energy_usage"],
+        "action": "mul",
+        "effects": {
+            "energy_usage": 0.5
+        },
+        "DP": 2
+    },
+    "high_projectile_speed": {
+        "name": "modifier.high_projectile_speed",
+        "description": "modifier.high_projectile_speed.description",
+        "texture": "modifiers.high_projectile_speed",
+        "incompatible": ["low_projectile_speed"],
+        "action": "mul",
+        "effects": {
+            "projectile_speed": 1.5
+        },
+        "DP": 2
+    },
+    "low_heating": {
+        "name": "modifier.low_heating",
+        "description": "modifier.low_heating.description",
+        "texture": "modifiers.low_heating",
+        "incompatible": ["high_heating"],
+        "action": "mul",
+        "effects": {
+            "heating": 0.8
+        },
+        "DP": 1
+    },
+    "high_laser_width": {
+        "name": "modifier.high_laser_width",
+        "description": "modifier.high_laser_width.description",
+        "texture": "modifiers.high_laser_width",
+        "incompatible": ["low_laser_width"],
+        "action": "mul",
+        "effects": {
+            "laser_width": 1.2
+        },
+        "DP": 1
+    },
+}
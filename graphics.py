@@ -0,0 +1,953 @@
+import math
+import os
+import random
+import pygame
+from pygame.locals import *
+import moderngl
+import numpy as np
+from array import array
+from collections import OrderedDict
+from contextlib import nullcontext
+
+
+# Frame ------------------------------------
+quad_vertices = array('f', [
+    # position (x, y), uv coords (x, y)
+    -1.0, 1.0, 0.0, 0.0,  # topleft
+    1.0, 1.0, 1.0, 0.0,  # topright
+    -1.0, -1.0, 0.0, 1.0,  # bottomleft
+    1.0, -1.0, 1.0, 1.0,  # bottomright
+])
+quad_buffers = {}
+
+
+def create_headless_context(backend=None):
+    # Standalone context for benchmarks and tools; falls back to EGL on machines without X
+    if backend is not None:
+        return moderngl.create_standalone_context(backend=backend)
+    try:
+        return moderngl.create_standalone_context()
+    except Exception:
+        return moderngl.create_standalone_context(backend="egl")
+
+
+def get_quad_buffer(context):
+    if context not in quad_buffers:
+        quad_buffers[context] = context.buffer(data=quad_vertices)
+    return quad_buffers[context]
+
+
+# Shaders ------------------------------------
+shader_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "shaders")
+shader_managers = {}
+
+
+def get_shaders(context):
+    if context not in shader_managers:
+        shader_managers[context] = ShaderManager(context, shader_directory)
+    return shader_managers[context]
+
+
+class CachedProgram:
+    # A program from the ShaderManager. Setting a uniform uploads it only when the value differs
+    # from the last one set, so per-frame code can set everything without paying for it. Vertex
+    # arrays are built from .program, which is swapped for the new one when the shader is reloaded.
+    def __init__(self, program):
+        self.program = program
+        self.values = {}
+
+    def __setitem__(self, name, value):
+        if self.values.get(name) != value:
+            # uniforms the driver optimized out (easy to cause while editing a shader) are skipped
+            uniform = self.program.get(name, None)
+            if uniform is not None:
+                uniform.value = value
+            self.values[name] = value
+
+    def replace(self, program):
+        self.program.release()
+        self.program = program
+        self.values = {}
+
+
+class ShaderManager:
+    # GLSL stages are read from files in `directory` once, however many programs share them (every
+    # post pass uses quad.vert). Programs are cached by stages, defines and varyings, so rebuilding
+    # the post chain or creating another renderer reuses the compiled program. Owners release their
+    # vertex arrays, never the programs. reload() (dev mode) recompiles programs whose files changed.
+    def __init__(self, context, directory):
+        self.ctx = context
+        self.directory = directory
+        # file name -> (mtime_ns, source)
+        self.sources = {}
+        self.programs = {}
+
+    def source(self, name):
+        if name not in self.sources:
+            path = os.path.join(self.directory, name)
+            with open(path, 'r', encoding='utf-8') as file:
+                self.sources[name] = (os.stat(path).st_mtime_ns, file.read())
+        return self.sources[name][1]
+
+    def expand(self, source, defines):
+        # defines go right after the #version line
+        if not defines:
+            return source
+        version, rest = source.split("\n", 1)
+        return "\n".join([version] + ["#define %s %s" % define for define in defines] + [rest])
+
+    def compile(self, key):
+        vertex, fragment, fragment_source, varyings, defines = key
+        if fragment is not None:
+            fragment_source = self.source(fragment)
+        if fragment_source is not None:
+            fragment_source = self.expand(fragment_source, defines)
+        return self.ctx.program(vertex_shader=self.expand(self.source(vertex), defines),
+                                fragment_shader=fragment_source, varyings=list(varyings))
+
+    def program(self, vertex, fragment=None, fragment_source=None, varyings=(), defines=None):
+        # vertex and fragment are file names, fragment_source is for generated shaders
+        key = (vertex, fragment, fragment_source, tuple(varyings), tuple(sorted((defines or {}).items())))
+        if key not in self.programs:
+            self.programs[key] = CachedProgram(self.compile(key))
+        return self.programs[key]
+
+    def reload(self):
+        # Returns True when a file changed; the caller then rebuilds whatever holds vertex arrays
+        changed = []
+        for name, (modified, _) in list(self.sources.items()):
+            try:
+                if os.stat(os.path.join(self.directory, name)).st_mtime_ns != modified:
+                    changed.append(name)
+            except OSError:
+                continue
+        if not changed:
+            return False
+        for name in changed:
+            del self.sources[name]
+        for key, cached in self.programs.items():
+            if key[0] in changed or key[1] in changed:
+                try:
+                    cached.replace(self.compile(key))
+                except moderngl.Error as error:
+                    # keep the last working program, the file is read again on its next change
+                    print("%s: %s" % (", ".join(changed), error))
+                    self.source(key[0])
+                    if key[1] is not None:
+                        self.source(key[1])
+        return True
+
+
+class FramePresenter:
+    # Keeps one GPU texture for the display surface and uploads only the regions that were drawn
+    # this frame or the previous one (the previous ones were cleared by display.fill).
+    def __init__(self, context, surface, full_upload_ratio=0.5):
+        self.surface = surface
+        self.bounds = surface.get_rect()
+        self.texture = context.texture(surface.get_size(), 4)
+        self.texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        self.texture.swizzle = 'BGRA'
+        self.full_upload_area = self.bounds.w * self.bounds.h * full_upload_ratio
+        self.dirty = []
+        self.previous = []
+        self.full = True
+
+    def blit(self, source, dest, area=None):
+        rect = self.surface.blit(source, dest, area)
+        self.dirty.append(rect)
+        return rect
+
+    def invalidate(self):
+        self.full = True
+
+    def merged_rects(self):
+        merged = []
+        for rect in self.previous + self.dirty:
+            rect = rect.clip(self.bounds)
+            if rect.w == 0 or rect.h == 0:
+                continue
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect.union_ip(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+    def present(self):
+        rects = self.merged_rects()
+        if self.full or sum(rect.w * rect.h for rect in rects) > self.full_upload_area:
+            self.texture.write(self.surface.get_view('1'))
+        else:
+            for rect in rects:
+                self.texture.write(pygame.image.tobytes(self.surface.subsurface(rect), 'BGRA'),
+                                   viewport=(rect.x, rect.y, rect.w, rect.h))
+        self.previous = self.dirty
+        self.dirty = []
+        self.full = False
+        return self.texture
+
+
+# Bloom ------------------------------------
+bloom_presets = {
+    # scale: downsample factor of the blur buffers, radius: taps on each side of the separable kernel
+    "low": {"scale": 4, "radius": 3, "sigma": 1.5},
+    "medium": {"scale": 2, "radius": 5, "sigma": 2.5},
+    "high": {"scale": 2, "radius": 8, "sigma": 4.0}
+}
+max_bloom_radius = 16
+
+
+def gaussian_weights(radius, sigma):
+    weights = [math.exp(-(i * i) / (2 * sigma * sigma)) for i in range(radius + 1)]
+    total = weights[0] + 2 * sum(weights[1:])
+    return [w / total for w in weights] + [0.0] * (max_bloom_radius + 1 - len(weights))
+
+
+class BloomPipeline:
+    # Bright pass into a downsampled buffer, separable horizontal/vertical blur, then the blurred
+    # buffer is added over the source while writing it to the target.
+    def __init__(self, context, size, preset):
+        self.ctx = context
+        self.size = size
+        self.threshold = 0.0
+        self.intensity = 0.8
+        shaders = get_shaders(context)
+        self.extract = shaders.program("quad.vert", "bloom_extract.frag")
+        self.blur = shaders.program("quad.vert", "bloom_blur.frag", defines={"MAX_BLOOM_RADIUS": max_bloom_radius})
+        self.composite = shaders.program("quad.vert", "bloom_composite.frag")
+        quad = [(get_quad_buffer(context), '2f 2f', 'vert', 'texcoord')]
+        self.render_extract = context.vertex_array(self.extract.program, quad)
+        self.render_blur = context.vertex_array(self.blur.program, quad)
+        self.render_composite = context.vertex_array(self.composite.program, quad)
+        self.buffers = []
+        self.preset = None
+        self.set_preset(preset)
+
+    def set_preset(self, preset):
+        if preset == self.preset:
+            return
+        scale = bloom_presets[preset]["scale"]
+        radius = min(bloom_presets[preset]["radius"], max_bloom_radius)
+        small_size = (max(1, self.size[0] // scale), max(1, self.size[1] // scale))
+        self.release_buffers()
+        for _ in range(2):
+            texture = self.ctx.texture(small_size, 4)
+            texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+            texture.repeat_x = False
+            texture.repeat_y = False
+            self.buffers.append((texture, self.ctx.framebuffer(color_attachments=[texture])))
+        self.small_size = small_size
+        self.radius = radius
+        self.weights = gaussian_weights(radius, bloom_presets[preset]["sigma"])
+        self.preset = preset
+
+    def release_buffers(self):
+        for texture, framebuffer in self.buffers:
+            framebuffer.release()
+            texture.release()
+        self.buffers = []
+
+    def render(self, source, target):
+        (ping_tex, ping), (pong_tex, pong) = self.buffers
+        source.use(0)
+        self.extract["tex"] = 0
+        self.extract["threshold"] = self.threshold
+        self.extract["texel"] = (1 / self.size[0], 1 / self.size[1])
+        ping.use()
+        self.render_extract.render(mode=moderngl.TRIANGLE_STRIP)
+
+        self.blur["tex"] = 0
+        self.blur["radius"] = self.radius
+        self.blur["weights"] = self.weights
+        ping_tex.use(0)
+        self.blur["direction"] = (1 / self.small_size[0], 0.0)
+        pong.use()
+        self.render_blur.render(mode=moderngl.TRIANGLE_STRIP)
+        pong_tex.use(0)
+        self.blur["direction"] = (0.0, 1 / self.small_size[1])
+        ping.use()
+        self.render_blur.render(mode=moderngl.TRIANGLE_STRIP)
+
+        target.use()
+        ping_tex.use(0)
+        source.use(1)
+        self.composite["tex"] = 0
+        self.composite["scene"] = 1
+        self.composite["bloomIntensity"] = self.intensity
+        self.render_composite.render(mode=moderngl.TRIANGLE_STRIP)
+
+    def release(self):
+        self.release_buffers()
+        # the programs belong to the ShaderManager
+        for vao in (self.render_extract, self.render_blur, self.render_composite):
+            vao.release()
+
+
+# Post processing ------------------------------------
+post_effects = {
+    # Cheap per-pixel effects, fused into one generated shader in this order.
+    # "uv" code moves the sample position, "color" code works on the sampled color.
+    "screen_shake": {
+        "stage": "uv",
+        "declarations": "uniform vec2 shake_offset;",
+        "uniforms": {"shake_offset": (0.0, 0.0)},
+        "code": "    uv += shake_offset;"
+    },
+    "other_distortion_effects": {
+        "stage": "uv",
+        "declarations": "uniform float curvature;",
+        "uniforms": {"curvature": 0.04},
+        "code": "    vec2 centered = uv - 0.5;\n"
+                "    uv = 0.5 + centered * (1.0 + curvature * dot(centered, centered) * 4.0);\n"
+                "    inside = step(0.0, uv.x) * step(uv.x, 1.0) * step(0.0, uv.y) * step(uv.y, 1.0);"
+    },
+    "chromatic_aberration": {
+        "stage": "color",
+        "declarations": "uniform float aberration;",
+        "uniforms": {"aberration": 0.004},
+        "code": "    vec2 aberration_offset = (uv - 0.5) * aberration;\n"
+                "    color.r = scene_at(uv + aberration_offset).r;\n"
+                "    color.b = scene_at(uv - aberration_offset).b;"
+    },
+    "tint": {
+        "stage": "color",
+        "declarations": "",
+        "uniforms": {},
+        "code": "    color.b *= 1.5;"
+    }
+}
+
+
+def fused_fragment_shader(effects, layered=False):
+    # With a layer (premultiplied alpha, e.g. the sprite batch) it is composited over tex at every
+    # sample, so effects apply to both without a separate full-screen pass.
+    if layered:
+        scene_at = """uniform sampler2D layer;
+
+vec4 scene_at(vec2 uv) {
+    vec4 over = texture(layer, uv);
+    return vec4(texture(tex, uv).rgb * (1.0 - over.a) + over.rgb, 1.0);
+}"""
+    else:
+        scene_at = """vec4 scene_at(vec2 uv) {
+    return texture(tex, uv);
+}"""
+    return """
+#version 330 core
+
+uniform sampler2D tex;
+%s
+
+in vec2 uvs;
+out vec4 f_color;
+
+%s
+
+void main() {
+    vec2 uv = uvs;
+    float inside = 1.0;
+%s
+    vec4 color = scene_at(uv);
+%s
+    f_color = vec4(color.rgb * inside, 1.0);
+}
+""" % ("\n".join(post_effects[name]["declarations"] for name in effects),
+       scene_at,
+       "\n".join(post_effects[name]["code"] for name in effects if post_effects[name]["stage"] == "uv"),
+       "\n".join(post_effects[name]["code"] for name in effects if post_effects[name]["stage"] == "color"))
+
+
+class FusedPass:
+    def __init__(self, context, effects):
+        self.ctx = context
+        self.effects = effects
+        self.uniforms = {}
+        for name in effects:
+            self.uniforms.update(post_effects[name]["uniforms"])
+        # the layered variant is only compiled once something actually draws into a layer
+        self.programs = {}
+
+    def program(self, layered):
+        if layered not in self.programs:
+            program = get_shaders(self.ctx).program(
+                "quad.vert", fragment_source=fused_fragment_shader(self.effects, layered))
+            vao = self.ctx.vertex_array(program.program, [(get_quad_buffer(self.ctx), '2f 2f', 'vert', 'texcoord')])
+            self.programs[layered] = (program, vao)
+        return self.programs[layered]
+
+    def render(self, source, target, layer=None):
+        program, vao = self.program(layer is not None)
+        target.use()
+        source.use(0)
+        program["tex"] = 0
+        if layer is not None:
+            layer.use(1)
+            program["layer"] = 1
+        for uniform, value in self.uniforms.items():
+            program[uniform] = value
+        vao.render(mode=moderngl.TRIANGLE_STRIP)
+
+    def release(self):
+        for _, vao in self.programs.values():
+            vao.release()
+        self.programs = {}
+
+
+class PostProcess:
+    # Builds the effect chain from settings: every enabled cheap effect goes into one fused pass,
+    # heavier multi-pass effects (bloom) follow it, and intermediate results ping-pong between two
+    # framebuffers. The chain is only rebuilt when one of the settings it depends on changes.
+    # An optional settings["render_scale"] below 1 runs the chain at a lower resolution, the last
+    # pass (bloom composite or a plain copy) scales it back up to the target.
+    def __init__(self, context, size, profiler=None):
+        self.ctx = context
+        self.size = size
+        self.profiler = profiler
+        self.key = None
+        self.passes = []
+        self.buffers = []
+        self.shake_scale = 0.0
+        self.shake_amount = 0.0
+
+    def build(self, settings):
+        render_scale = settings.get("render_scale", 1.0)
+        key = (settings["bloom"], settings["bloom_quality"], settings["chromatic_aberration"],
+               settings["other_distortion_effects"], settings["screen_shake"] > 0, render_scale)
+        if key == self.key:
+            self.shake_scale = settings["screen_shake"]
+            return
+        self.release()
+        size = (max(1, int(self.size[0] * render_scale)), max(1, int(self.size[1] * render_scale)))
+        effects = [name for name in ("screen_shake", "other_distortion_effects", "chromatic_aberration")
+                   if settings[name]] + ["tint"]
+        self.passes.append(FusedPass(self.ctx, effects))
+        if settings["bloom"]:
+            self.passes.append(BloomPipeline(self.ctx, size, settings["bloom_quality"]))
+        elif render_scale < 1:
+            self.passes.append(FusedPass(self.ctx, []))
+        for _ in range(min(len(self.passes) - 1, 2)):
+            texture = self.ctx.texture(size, 4)
+            filtering = moderngl.LINEAR if render_scale < 1 else moderngl.NEAREST
+            texture.filter = (filtering, filtering)
+            self.buffers.append((texture, self.ctx.framebuffer(color_attachments=[texture])))
+        self.shake_scale = settings["screen_shake"]
+        self.key = key
+
+    def shake(self, amount):
+        self.shake_amount = max(self.shake_amount, amount)
+
+    def update(self):
+        self.shake_amount *= 0.9
+        if self.shake_amount < 0.0001:
+            self.shake_amount = 0.0
+
+    def update_shake(self, fused):
+        if "screen_shake" not in fused.effects:
+            return
+        angle = random.uniform(0, math.tau)
+        strength = self.shake_amount * self.shake_scale
+        fused.uniforms["shake_offset"] = (math.cos(angle) * strength, math.sin(angle) * strength)
+
+    def render(self, source, target, layer=None):
+        self.update_shake(self.passes[0])
+        for i, render_pass in enumerate(self.passes):
+            # keyed by position too, a chain can hold two passes of the same type
+            with (self.profiler.gpu_stage("%d.%s" % (i, type(render_pass).__name__)) if self.profiler
+                  else nullcontext()):
+                output = target if i == len(self.passes) - 1 else self.buffers[i % 2][1]
+                if i == 0:
+                    render_pass.render(source, output, layer)
+                else:
+                    render_pass.render(source, output)
+                if output is not target:
+                    source = self.buffers[i % 2][0]
+
+    def release(self):
+        for render_pass in self.passes:
+            render_pass.release()
+        for texture, framebuffer in self.buffers:
+            framebuffer.release()
+            texture.release()
+        self.passes = []
+        self.buffers = []
+        self.key = None
+
+
+# Sprites ------------------------------------
+# x, y, w, h, rotation, u0, v0, u1, v1, r, g, b, a
+sprite_instance_floats = 13
+
+
+class SpriteBatch:
+    # Collects sprites per atlas page into numpy instance arrays and draws each page with one
+    # instanced call into a transparent, premultiplied layer (composited by PostProcess).
+    # `store` is anything with region(key) -> (page surface, rect), i.e. the TextureStore.
+    def __init__(self, context, store, size, capacity=1024):
+        self.ctx = context
+        self.store = store
+        self.size = size
+        self.capacity = capacity
+        self.program = get_shaders(context).program("sprite.vert", "sprite.frag")
+        self.layer = context.texture(size, 4)
+        self.layer.filter = (moderngl.NEAREST, moderngl.NEAREST)
+        self.framebuffer = context.framebuffer(color_attachments=[self.layer])
+        self.pages = {}
+        self.regions = {}
+        self.count = 0
+
+    def page(self, surface):
+        # per page: GPU texture, instance array, used instances, instance buffer, vertex array
+        key = id(surface)
+        if key not in self.pages:
+            texture = self.ctx.texture(surface.get_size(), 4, pygame.image.tobytes(surface, 'RGBA'))
+            texture.filter = (moderngl.NEAREST, moderngl.NEAREST)
+            self.pages[key] = [texture, np.zeros((self.capacity, sprite_instance_floats), 'f4'), 0, None, None]
+        return self.pages[key]
+
+    def region(self, key):
+        if key not in self.regions:
+            region = self.store.region(key)
+            if region is None:
+                self.regions[key] = None
+            else:
+                surface, rect = region
+                width, height = surface.get_size()
+                uv = (rect.x / width, rect.y / height, rect.right / width, rect.bottom / height)
+                self.regions[key] = (self.page(surface), rect.w, rect.h, uv)
+        return self.regions[key]
+
+    def reserve(self, page, count):
+        if page[2] + count > len(page[1]):
+            grown = np.zeros((max(len(page[1]) * 2, page[2] + count), sprite_instance_floats), 'f4')
+            grown[:page[2]] = page[1][:page[2]]
+            page[1] = grown
+        start = page[2]
+        page[2] += count
+        self.count += count
+        return page[1][start:page[2]]
+
+    def draw(self, key, x, y, rotation=0.0, scale=1.0, tint=(1.0, 1.0, 1.0, 1.0)):
+        region = self.region(key)
+        if region is None:
+            return
+        page, width, height, uv = region
+        self.reserve(page, 1)[0] = (x, y, width * scale, height * scale, rotation, *uv, *tint)
+
+    def draw_many(self, key, positions, rotations=0.0, scales=1.0, tints=(1.0, 1.0, 1.0, 1.0)):
+        # Vectorized draw: positions is (n, 2), the rest are scalars or per-sprite arrays
+        region = self.region(key)
+        if region is None or len(positions) == 0:
+            return
+        page, width, height, uv = region
+        instances = self.reserve(page, len(positions))
+        scales = np.asarray(scales, 'f4')
+        instances[:, 0:2] = positions
+        instances[:, 2] = width * scales
+        instances[:, 3] = height * scales
+        instances[:, 4] = rotations
+        instances[:, 5:9] = uv
+        instances[:, 9:13] = tints
+
+    def reload_shaders(self):
+        # vertex arrays are tied to the program they were built with, the next render builds new ones
+        for page in self.pages.values():
+            if page[3] is not None:
+                page[4].release()
+                page[3].release()
+                page[3], page[4] = None, None
+
+    def render(self, underlay=None, overlay=None):
+        # Returns the layer texture, or None when nothing was drawn this frame. `underlay` (e.g. the
+        # TileMapRenderer) draws into the layer first, under the sprites, `overlay` (the
+        # ParticleSystem) after them.
+        if self.count == 0 and underlay is None and overlay is None:
+            return None
+        self.framebuffer.use()
+        self.framebuffer.clear(0.0, 0.0, 0.0, 0.0)
+        self.ctx.enable(moderngl.BLEND)
+        self.ctx.blend_func = moderngl.ONE, moderngl.ONE_MINUS_SRC_ALPHA
+        # programs are shared, uniforms that differ between users are set on every use (they are
+        # only uploaded when they changed)
+        self.program["screen_size"] = self.size
+        if underlay is not None:
+            underlay.render()
+        for page in self.pages.values():
+            texture, instances, used, buffer, vao = page
+            if used == 0:
+                continue
+            if buffer is None or buffer.size < instances.nbytes:
+                if buffer is not None:
+                    vao.release()
+                    buffer.release()
+                buffer = self.ctx.buffer(reserve=instances.nbytes, dynamic=True)
+                vao = self.ctx.vertex_array(self.program.program, [
+                    (get_quad_buffer(self.ctx), '2f 2f', 'vert', 'texcoord'),
+                    (buffer, '4f 1f 4f 4f /i', 'rect', 'rotation', 'uv_rect', 'tint')
+                ])
+                page[3], page[4] = buffer, vao
+            buffer.write(instances[:used])
+            texture.use(0)
+            self.program["tex"] = 0
+            vao.render(mode=moderngl.TRIANGLE_STRIP, instances=used)
+            page[2] = 0
+        if overlay is not None:
+            overlay.render()
+        self.ctx.disable(moderngl.BLEND)
+        self.count = 0
+        return self.layer
+
+
+# Tile map ------------------------------------
+# the two triangles of a tile, as corner offsets
+tile_corners_x = np.array([0, 1, 0, 0, 1, 1], 'f4')
+tile_corners_y = np.array([0, 0, 1, 1, 1, 0], 'f4')
+
+
+class TileMapRenderer:
+    # One static vertex buffer per chunk and atlas page, built from the tilemap.TileMap chunk and
+    # rebuilt only when the chunk's revision changed. Only chunks overlapping the camera are drawn
+    # (or built at all), meshes of chunks that scrolled away are released. Tile ids without a texture
+    # get a flat placeholder color.
+    # Used as the SpriteBatch underlay: sprites.render(tile_renderer).
+    def __init__(self, context, store, tiles, size, tile_size=32):
+        self.ctx = context
+        self.size = size
+        self.tile_size = tile_size
+        self.program = get_shaders(context).program("tile.vert", "tile.frag")
+        self.map = None
+        self.camera = (0.0, 0.0)
+        # (row, column) -> (revision, [(texture, buffer, vertex array, vertices)])
+        self.chunks = {}
+        self.textures = {}
+        self.build_lookup(store, tiles)
+
+    def build_lookup(self, store, tiles):
+        # tile id -> atlas page index and uv rect, as arrays so whole chunks can be looked up at once
+        self.pages = []
+        self.page_of = np.full(max(tiles) + 1, -1, dtype=np.int64)
+        self.uv = np.zeros((max(tiles) + 1, 4), 'f4')
+        missing = []
+        for tile, key in tiles.items():
+            region = store.region(key)
+            if region is None:
+                missing.append(tile)
+                continue
+            surface, rect = region
+            if surface not in self.pages:
+                self.pages.append(surface)
+            width, height = surface.get_size()
+            self.page_of[tile] = self.pages.index(surface)
+            self.uv[tile] = (rect.x / width, rect.y / height, rect.right / width, rect.bottom / height)
+        if missing:
+            placeholder = pygame.Surface((len(missing), 1), pygame.SRCALPHA)
+            for i, tile in enumerate(missing):
+                color = pygame.Color(0)
+                color.hsva = (tile * 47 % 360, 40, 35, 100)
+                placeholder.set_at((i, 0), color)
+                self.page_of[tile] = len(self.pages)
+                self.uv[tile] = ((i + 0.5) / len(missing), 0.5, (i + 0.5) / len(missing), 0.5)
+            self.pages.append(placeholder)
+
+    def texture(self, page):
+        if page not in self.textures:
+            surface = self.pages[page]
+            self.textures[page] = self.ctx.texture(surface.get_size(), 4, pygame.image.tobytes(surface, 'RGBA'))
+            self.textures[page].filter = (moderngl.NEAREST, moderngl.NEAREST)
+        return self.textures[page]
+
+    def set_map(self, tile_map):
+        self.release_chunks()
+        self.map = tile_map
+
+    def build(self, row, column):
+        chunk = np.asarray(self.map.chunk(row, column))
+        ys, xs = np.nonzero(chunk)
+        ids = chunk[ys, xs].astype(np.int64)
+        known = ids < len(self.page_of)
+        ys, xs, ids = ys[known], xs[known], ids[known]
+        pages = self.page_of[ids]
+        x = ((column * self.map.chunk_size + xs) * self.tile_size).astype('f4')
+        y = ((row * self.map.chunk_size + ys) * self.tile_size).astype('f4')
+        meshes = []
+        for page in np.unique(pages[pages >= 0]):
+            selected = pages == page
+            uv = self.uv[ids[selected]]
+            vertices = np.empty((int(selected.sum()), 6, 4), 'f4')
+            vertices[:, :, 0] = x[selected, None] + tile_corners_x * self.tile_size
+            vertices[:, :, 1] = y[selected, None] + tile_corners_y * self.tile_size
+            vertices[:, :, 2] = uv[:, 0, None] + (uv[:, 2] - uv[:, 0])[:, None] * tile_corners_x
+            vertices[:, :, 3] = uv[:, 1, None] + (uv[:, 3] - uv[:, 1])[:, None] * tile_corners_y
+            buffer = self.ctx.buffer(vertices.tobytes())
+            vao = self.ctx.vertex_array(self.program.program, [(buffer, '2f 2f', 'position', 'texcoord')])
+            meshes.append((self.texture(int(page)), buffer, vao, vertices.shape[0] * 6))
+        return meshes
+
+    def render(self):
+        # Draws into whatever framebuffer is bound, SpriteBatch sets up blending
+        if self.map is None:
+            return
+        x, y = self.camera
+        self.program["screen_size"] = self.size
+        self.program["camera"] = (x, y)
+        self.program["tex"] = 0
+        # meshes of chunks more than one chunk off screen are dropped, so the cache stays a screenful
+        span = self.map.chunk_size * self.tile_size
+        kept = set(self.map.visible_chunks(x - span, y - span, x + self.size[0] + span, y + self.size[1] + span,
+                                           self.tile_size))
+        for key in [key for key in self.chunks if key not in kept]:
+            self.release_chunk(key)
+        for key in self.map.visible_chunks(x, y, x + self.size[0], y + self.size[1], self.tile_size):
+            revision = self.map.revisions[key]
+            if key not in self.chunks or self.chunks[key][0] != revision:
+                self.release_chunk(key)
+                self.chunks[key] = (revision, self.build(*key))
+            for texture, _, vao, vertices in self.chunks[key][1]:
+                texture.use(0)
+                vao.render(moderngl.TRIANGLES, vertices=vertices)
+
+    def reload_shaders(self):
+        self.release_chunks()
+
+    def release_chunk(self, key):
+        for _, buffer, vao, _ in self.chunks.pop(key, (0, []))[1]:
+            vao.release()
+            buffer.release()
+
+    def release_chunks(self):
+        for key in list(self.chunks):
+            self.release_chunk(key)
+
+
+# Particles ------------------------------------
+# x, y, vx, vy, age, lifetime, drag, size, r, g, b, a
+particle_floats = 12
+particle_presets = {
+    # speed and lifetime are (min, max), spread is the cone around the emit angle in radians,
+    # rate is particles per second for continuous emitters (emit_many)
+    "engine": {"count": 4, "rate": 90, "speed": (40, 90), "spread": 0.35, "lifetime": (0.25, 0.5),
+               "drag": 0.2, "size": 7.0, "color": (1.0, 0.55, 0.2, 0.9)},
+    "explosion": {"count": 400, "rate": 0, "speed": (60, 420), "spread": math.tau, "lifetime": (0.4, 1.2),
+                  "drag": 0.05, "size": 9.0, "color": (1.0, 0.7, 0.3, 1.0)},
+    "overheat": {"count": 12, "rate": 40, "speed": (10, 40), "spread": math.tau, "lifetime": (0.6, 1.0),
+                 "drag": 0.5, "size": 6.0, "color": (1.0, 0.25, 0.1, 0.8)},
+    "laser": {"count": 24, "rate": 0, "speed": (80, 200), "spread": 0.8, "lifetime": (0.1, 0.3),
+              "drag": 0.1, "size": 5.0, "color": (0.5, 0.8, 1.0, 1.0)}
+}
+
+
+class ParticleSystem:
+    # Particles live only on the GPU: two buffers of `capacity` particles, a transform feedback pass
+    # steps every particle from one into the other each tick and they swap. New particles are
+    # collected in numpy and written into a ring at `head` just before the step, so the oldest
+    # particle gets overwritten when the ring is full. Drawn with one instanced call, additive
+    # (alpha 0) into the sprite layer: sprites.render(underlay, particles).
+    def __init__(self, context, size, capacity=65536):
+        self.ctx = context
+        self.size = size
+        self.capacity = capacity
+        self.camera = (0.0, 0.0)
+        shaders = get_shaders(context)
+        self.update_program = shaders.program("particle_update.vert", varyings=(
+            "out_position", "out_velocity", "out_life", "out_size", "out_color"))
+        self.render_program = shaders.program("particle.vert", "particle.frag")
+        self.buffers = [context.buffer(reserve=capacity * particle_floats * 4) for _ in range(2)]
+        for buffer in self.buffers:
+            buffer.clear()
+        self.build_vertex_arrays()
+        # the step draws with rasterization off but still needs a complete framebuffer bound, which a
+        # headless context doesn't have by default
+        self.step_target = context.simple_framebuffer((1, 1))
+        self.current = 0
+        self.head = 0
+        # slots in use (the ring only grows until it wraps) and time until the newest particle expires
+        self.count = 0
+        self.remaining = 0.0
+        self.pending = []
+        self.rng = np.random.default_rng()
+
+    def build_vertex_arrays(self):
+        self.steps = [self.ctx.vertex_array(self.update_program.program, [
+            (buffer, '2f 2f 3f 1f 4f', 'in_position', 'in_velocity', 'in_life', 'in_size', 'in_color')
+        ]) for buffer in self.buffers]
+        self.draws = [self.ctx.vertex_array(self.render_program.program, [
+            (get_quad_buffer(self.ctx), '2f 8x', 'vert'),
+            (buffer, '2f 8x 3f 1f 4f /i', 'position', 'life', 'size', 'color')
+        ]) for buffer in self.buffers]
+
+    def reload_shaders(self):
+        for vao in self.steps + self.draws:
+            vao.release()
+        self.build_vertex_arrays()
+
+    @property
+    def live(self):
+        return self.count > 0 or bool(self.pending)
+
+    def spawn(self, positions, angles, preset, count):
+        # count particles per position, angles is the emit direction of each position
+        n = len(positions) * count
+        if n == 0:
+            return
+        particles = np.empty((n, particle_floats), 'f4')
+        directions = (np.repeat(np.asarray(angles, 'f4'), count)
+                      + self.rng.uniform(-0.5, 0.5, n) * preset["spread"])
+        speeds = self.rng.uniform(*preset["speed"], n)
+        particles[:, 0:2] = np.repeat(np.asarray(positions, 'f4').reshape(-1, 2), count, axis=0)
+        particles[:, 2] = np.cos(directions) * speeds
+        particles[:, 3] = np.sin(directions) * speeds
+        particles[:, 4] = 0.0
+        particles[:, 5] = self.rng.uniform(*preset["lifetime"], n)
+        particles[:, 6] = preset["drag"]
+        particles[:, 7] = preset["size"] * self.rng.uniform(0.6, 1.4, n)
+        particles[:, 8:12] = preset["color"]
+        self.pending.append(particles)
+        self.remaining = max(self.remaining, preset["lifetime"][1])
+
+    def emit(self, name, x, y, angle=0.0, count=None):
+        # One burst (explosion, laser impact)
+        preset = particle_presets[name]
+        self.spawn(((x, y),), (angle,), preset, preset["count"] if count is None else count)
+
+    def emit_many(self, name, positions, angles, dt):
+        # Continuous emitters (engine trails, overheating ships), one per row of positions: each
+        # emits rate * dt particles, the fraction is rounded randomly so low rates still emit
+        preset = particle_presets[name]
+        if len(positions) == 0:
+            return
+        expected = preset["rate"] * dt
+        count = int(expected) + (self.rng.random() < expected - int(expected))
+        self.spawn(positions, angles, preset, count)
+
+    def upload(self):
+        particles = np.concatenate(self.pending)[-self.capacity:]
+        self.pending = []
+        source = self.buffers[self.current]
+        stride = particle_floats * 4
+        first = min(len(particles), self.capacity - self.head)
+        source.write(particles[:first].tobytes(), offset=self.head * stride)
+        if first < len(particles):
+            source.write(particles[first:].tobytes())
+        self.head = (self.head + len(particles)) % self.capacity
+        self.count = min(self.count + len(particles), self.capacity)
+
+    def update(self, dt):
+        if self.pending:
+            self.upload()
+        if self.count == 0:
+            return
+        self.remaining -= dt
+        if self.remaining <= 0:
+            # everything has expired, start the ring over
+            self.count = self.head = 0
+            self.remaining = 0.0
+            return
+        self.update_program["dt"] = dt
+        self.step_target.use()
+        self.steps[self.current].transform(self.buffers[1 - self.current], moderngl.POINTS, vertices=self.count)
+        self.current = 1 - self.current
+
+    def render(self):
+        # Draws into whatever framebuffer is bound, SpriteBatch sets up blending
+        if self.count == 0:
+            return
+        self.render_program["screen_size"] = self.size
+        self.render_program["camera"] = self.camera
+        self.draws[self.current].render(moderngl.TRIANGLE_STRIP, instances=self.count)
+
+    def release(self):
+        for vao in self.steps + self.draws:
+            vao.release()
+        for buffer in self.buffers:
+            buffer.release()
+        self.step_target.release()
+
+
+# Text ------------------------------------
+class GlyphAtlas:
+    # White glyphs of one font (and antialias mode) packed into shelf-allocated pages.
+    def __init__(self, font, antialias, page_size=(512, 512)):
+        self.font = font
+        self.antialias = antialias
+        self.page_size = page_size
+        self.pages = []
+        self.glyphs = {}
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+        self.height = font.get_height()
+
+    def new_page(self):
+        page = pygame.Surface(self.page_size, SRCALPHA)
+        page.fill((0, 0, 0, 0))
+        self.pages.append(page)
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    def glyph(self, char):
+        if char in self.glyphs:
+            return self.glyphs[char]
+        surface = self.font.render(char, self.antialias, (255, 255, 255))
+        if surface.get_alpha() is None and surface.get_colorkey() is not None:
+            # without antialiasing it's an 8-bit colorkeyed surface, BLEND_RGBA_MAX would ignore the key
+            keyed = surface
+            surface = pygame.Surface(keyed.get_size(), SRCALPHA)
+            surface.fill((0, 0, 0, 0))
+            surface.blit(keyed, (0, 0))
+        width, height = surface.get_size()
+        metrics = self.font.metrics(char)
+        advance = metrics[0][4] if metrics and metrics[0] else width
+        if not self.pages or self.shelf_x + width > self.page_size[0]:
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+        if not self.pages or self.shelf_y + height > self.page_size[1]:
+            self.new_page()
+        rect = pygame.Rect(self.shelf_x, self.shelf_y, width, height)
+        self.pages[-1].blit(surface, rect, special_flags=BLEND_RGBA_MAX)
+        self.shelf_x += width
+        self.shelf_height = max(self.shelf_height, height)
+        self.height = max(self.height, height)
+        self.glyphs[char] = (len(self.pages) - 1, rect, advance)
+        return self.glyphs[char]
+
+
+class TextRenderer:
+    # Strings are composed from atlas glyphs instead of being rasterized by the font, and the
+    # tinted result is kept in an LRU cache keyed by (font, text, color, antialias).
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.atlases = {}
+        self.strings = OrderedDict()
+
+    def atlas(self, font, antialias):
+        key = (font, antialias)
+        if key not in self.atlases:
+            self.atlases[key] = GlyphAtlas(font, antialias)
+        return self.atlases[key]
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, tuple(color), antialias)
+        if key in self.strings:
+            self.strings.move_to_end(key)
+            return self.strings[key]
+        atlas = self.atlas(font, antialias)
+        glyphs = [atlas.glyph(char) for char in text]
+        width = sum(advance for _, _, advance in glyphs[:-1])
+        if glyphs:
+            width += max(glyphs[-1][2], glyphs[-1][1].w)
+        surface = pygame.Surface((max(width, 1), atlas.height), SRCALPHA)
+        surface.fill((0, 0, 0, 0))
+        pen_x = 0
+        for page, rect, advance in glyphs:
+            surface.blit(atlas.pages[page], (pen_x, 0), rect, special_flags=BLEND_RGBA_MAX)
+            pen_x += advance
+        surface.fill(tuple(color)[:3] + (255,), special_flags=BLEND_RGBA_MULT)
+        self.strings[key] = surface
+        if len(self.strings) > self.capacity:
+            self.strings.popitem(last=False)
+        return surface
+
+    def invalidate(self):
+        self.strings.clear()
+        self.atlases.clear()
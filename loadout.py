@@ -0,0 +1,126 @@
+import numba
+import numpy as np
+from stats import resolve_stats
+
+
+@numba.njit(cache=True)
+def popcount(mask):
+    count = 0
+    while mask:
+        mask &= mask - 1
+        count += 1
+    return count
+
+
+@numba.njit(cache=True)
+def enumerate_loadouts(conflicts, costs, unstable, slots, dp, unstable_slots):
+    # Depth-first over modifiers in index order. A branch is cut as soon as it takes a conflicting
+    # modifier or runs out of slots; every node is itself a loadout and is kept if it fits the DP.
+    n = costs.shape[0]
+    found = []
+    stack_mask = np.zeros(n + 1, dtype=np.int64)
+    stack_banned = np.zeros(n + 1, dtype=np.int64)
+    stack_cost = np.zeros(n + 1, dtype=np.int64)
+    stack_next = np.zeros(n + 1, dtype=np.int64)
+    depth = 0
+    found.append(np.int64(0))
+    while depth >= 0:
+        i = stack_next[depth]
+        if i >= n or depth >= slots:
+            depth -= 1
+            continue
+        stack_next[depth] = i + 1
+        bit = np.int64(1) << i
+        if stack_banned[depth] & bit:
+            continue
+        mask = stack_mask[depth] | bit
+        if unstable & bit and popcount(mask & unstable) > unstable_slots:
+            continue
+        cost = stack_cost[depth] + costs[i]
+        if cost <= dp:
+            found.append(mask)
+        depth += 1
+        stack_mask[depth] = mask
+        stack_banned[depth] = stack_banned[depth - 1] | conflicts[i]
+        stack_cost[depth] = cost
+        stack_next[depth] = i + 1
+    return np.array(found)
+
+
+class LoadoutRules:
+    # Bitmask index of the modifiers table (todo.txt rules): one bit per modifier, a conflict mask
+    # per modifier from "incompatible" (both ways), DP costs and the unstable flag. Sums and
+    # conflicts of a whole mask come from per-byte lookup tables, so validating a loadout is a
+    # handful of table lookups no matter how many modifiers it holds.
+    def __init__(self, modifiers):
+        self.keys = list(modifiers.keys())
+        if len(self.keys) > 62:
+            raise ValueError("loadout masks hold at most 62 modifiers")
+        self.bits = {key: 1 << i for i, key in enumerate(self.keys)}
+        self.costs = np.array([modifiers[key]["DP"] for key in self.keys], dtype=np.int64)
+        self.conflicts = np.zeros(len(self.keys), dtype=np.int64)
+        for i, key in enumerate(self.keys):
+            for other in modifiers[key]["incompatible"]:
+                self.conflicts[i] |= self.bits[other]
+                self.conflicts[self.keys.index(other)] |= self.bits[key]
+        self.unstable = 0
+        for key in self.keys:
+            if modifiers[key].get("unstable", False):
+                self.unstable |= self.bits[key]
+
+        self.chunks = (len(self.keys) + 7) // 8
+        self.chunk_costs = np.zeros((self.chunks, 256), dtype=np.int64)
+        self.chunk_conflicts = np.zeros((self.chunks, 256), dtype=np.int64)
+        for chunk in range(self.chunks):
+            for byte in range(256):
+                for bit in range(8):
+                    i = chunk * 8 + bit
+                    if byte & (1 << bit) and i < len(self.keys):
+                        self.chunk_costs[chunk, byte] += self.costs[i]
+                        self.chunk_conflicts[chunk, byte] |= self.conflicts[i]
+
+    def mask(self, loadout):
+        mask = 0
+        for key in loadout:
+            mask |= self.bits[key]
+        return mask
+
+    def loadout(self, mask):
+        return [key for i, key in enumerate(self.keys) if mask >> i & 1]
+
+    def cost(self, mask):
+        return int(sum(self.chunk_costs[chunk, mask >> (chunk * 8) & 0xff] for chunk in range(self.chunks)))
+
+    def conflicts_of(self, mask):
+        conflicts = 0
+        for chunk in range(self.chunks):
+            conflicts |= int(self.chunk_conflicts[chunk, mask >> (chunk * 8) & 0xff])
+        return conflicts
+
+    def validate(self, mask, slots, dp, unstable_slots):
+        return (mask.bit_count() <= slots and (mask & self.unstable).bit_count() <= unstable_slots
+                and mask & self.conflicts_of(mask) == 0 and self.cost(mask) <= dp)
+
+    def enumerate(self, slots, dp, unstable_slots):
+        # Every legal loadout for the budget, as an int64 array of masks (the empty loadout included)
+        return enumerate_loadouts(self.conflicts, self.costs, np.int64(self.unstable), slots, dp, unstable_slots)
+
+    def masks_to_matrix(self, masks):
+        bits = np.int64(1) << np.arange(len(self.keys), dtype=np.int64)
+        return (masks[:, None] & bits[None, :]) != 0
+
+    def suggest(self, engine, weights, slots, dp, unstable_slots, count=5):
+        # Best loadouts by a weighted sum of stats relative to the base ship, e.g.
+        # {"damage": 1.0, "attack_speed": 0.5, "heating": -0.5}. Resolves every legal loadout at once.
+        masks = self.enumerate(slots, dp, unstable_slots)
+        order = [engine.modifier_index[key] for key in self.keys]
+        matrix = np.zeros((len(masks), len(engine.modifiers)), dtype=np.bool_)
+        matrix[:, order] = self.masks_to_matrix(masks)
+        stats = resolve_stats(matrix, engine.base, engine.multipliers, engine.overrides, engine.override_mask)
+        weight_vector = np.zeros(len(engine.stats))
+        for name, weight in weights.items():
+            weight_vector[engine.stat_index[name]] = weight
+        base = np.where(engine.base == 0, 1.0, engine.base)
+        scores = (stats / base) @ weight_vector
+        best = np.argsort(-scores, kind="stable")[:count]
+        return [(self.loadout(int(masks[i])), float(scores[i])) for i in best]
@@ -0,0 +1,134 @@
+import json
+import os
+import struct
+import numpy as np
+
+# Compiled table: header, then count + 1 uint32 offsets into the UTF-8 blob, the blob itself and
+# one flag byte per string (0 = missing in this language).
+#   <4sHIqqqq  magic, version, count, source mtime_ns / size, fallback source mtime_ns / size
+# String ids are the positions of the fallback language's keys (sorted), so every compiled table
+# of the same fallback lines up. The fallback table stores its keys as a second offsets + blob.
+# Keys that only exist in other languages are never looked up.
+table_header = struct.Struct("<4sHIqqqq")
+table_magic = b"BSPT"
+table_version = 1
+
+
+def pack_strings(strings):
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<u4')
+    offsets[1:] = np.cumsum([len(string) for string in encoded])
+    return offsets.tobytes() + b"".join(encoded)
+
+
+def unpack_strings(data, offset, count):
+    offsets = np.frombuffer(data, '<u4', count + 1, offset)
+    start = offset + offsets.nbytes
+    raw = data[start:start + int(offsets[-1])]
+    strings = [raw[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(count)]
+    return strings, start + int(offsets[-1])
+
+
+class Localization:
+    # Languages are compiled from locales/<lang>.json into binary tables under the cache directory
+    # and only the active language and the fallback are ever loaded. translate() returns strings
+    # from a per-language dict that is filled on first use, so menus pay one dict lookup per label.
+    def __init__(self, directory, cache_directory, fallback="en_us"):
+        self.directory = directory
+        self.cache_directory = cache_directory
+        self.fallback = fallback
+        self.languages = sorted(os.path.splitext(filename)[0] for filename in os.listdir(directory)
+                                if filename.endswith('.json'))
+        self.tables = {}
+        self.keys = None
+        self.ids = None
+        self.language = None
+        self.resolved = {}
+
+    def source_path(self, lang):
+        return os.path.join(self.directory, lang + '.json')
+
+    def table_path(self, lang):
+        return os.path.join(self.cache_directory, lang + '.bin')
+
+    def signature(self, lang):
+        stat = os.stat(self.source_path(lang))
+        return stat.st_mtime_ns, stat.st_size
+
+    def compile(self, lang):
+        with open(self.source_path(lang), 'r', encoding='utf-8') as file:
+            source = json.load(file)
+        if lang == self.fallback:
+            keys = sorted(source)
+        else:
+            keys = self.fallback_keys()
+        strings = [source.get(key, "") for key in keys]
+        present = np.array([key in source for key in keys], dtype=np.uint8)
+        data = table_header.pack(table_magic, table_version, len(keys), *self.signature(lang),
+                                 *self.signature(self.fallback)) + pack_strings(strings) + present.tobytes()
+        if lang == self.fallback:
+            data += pack_strings(keys)
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            with open(self.table_path(lang), 'wb') as file:
+                file.write(data)
+        except OSError:
+            pass
+        return data
+
+    def read(self, lang):
+        try:
+            with open(self.table_path(lang), 'rb') as file:
+                data = file.read()
+            magic, version, _, *signatures = table_header.unpack_from(data)
+        except (OSError, struct.error):
+            return self.compile(lang)
+        if (magic != table_magic or version != table_version
+                or tuple(signatures) != self.signature(lang) + self.signature(self.fallback)):
+            return self.compile(lang)
+        return data
+
+    def fallback_keys(self):
+        if self.keys is None:
+            self.table(self.fallback)
+        return self.keys
+
+    def table(self, lang):
+        # Strings of a language by id, None where the language doesn't have one
+        if lang not in self.tables:
+            data = self.read(lang)
+            count = table_header.unpack_from(data)[2]
+            strings, offset = unpack_strings(data, table_header.size, count)
+            present = np.frombuffer(data, np.uint8, count, offset)
+            if lang == self.fallback:
+                self.keys, _ = unpack_strings(data, offset + count, count)
+                self.ids = {key: i for i, key in enumerate(self.keys)}
+            self.tables[lang] = [string if flag else None for string, flag in zip(strings, present)]
+        return self.tables[lang]
+
+    def id(self, key):
+        self.fallback_keys()
+        return self.ids.get(key, -1)
+
+    def set_language(self, lang):
+        if lang not in self.languages:
+            lang = self.fallback
+        if lang == self.language:
+            return
+        if self.language is not None and self.language != self.fallback:
+            # only the active language and the fallback stay loaded
+            self.tables.pop(self.language, None)
+        self.language = lang
+        self.resolved = {}
+
+    def text(self, string_id):
+        if string_id >= 0:
+            for table in (self.table(self.language), self.table(self.fallback)):
+                if table[string_id] is not None:
+                    return table[string_id]
+        return "404"
+
+    def translate(self, key):
+        if key not in self.resolved:
+            self.resolved[key] = self.text(self.id(key))
+        return self.resolved[key]
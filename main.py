@@ -1,11 +1,29 @@
+import time
+# before the heavy imports, so time to first frame covers them too
+launch_time = time.perf_counter()
 import math
 import pygame
 from pygame.locals import *
 import moderngl
 import os
+import sys
 import json
+import threading
 import numba
-from array import array
+from collections import deque
+from contextlib import contextmanager
+from assets import TextureStore
+from audio import AudioMixer
+from stats import StatEngine
+from loadout import LoadoutRules
+from localization import Localization
+from net import NetClient
+from replay import InputLog
+from settings_store import SettingsStore
+from gamedata import tiles, ship_stats, modifiers
+from graphics import (FramePresenter, FusedPass, ParticleSystem, PostProcess, SpriteBatch, TextRenderer,
+                      TileMapRenderer, create_headless_context, get_shaders)
+from warmup import warm_client
 
 
 @numba.njit(cache=True)
@@ -13,709 +31,938 @@ def linear_interpolation(x0: int, x1: int, p: float) -> float:
     return x0 + (x1 - x0) * p
 
 
+# BYTED_HEADLESS=1 runs without a window on a standalone GL context (benchmarks, CI), so does a
+# --fast-forward replay
+if __name__ == "__main__" and "--fast-forward" in sys.argv and "--replay" not in sys.argv:
+    # there is nothing to fast forward through, it would run headless with no end
+    sys.exit("usage: main.py --replay <file> --fast-forward")
+headless = os.environ.get("BYTED_HEADLESS") == "1" or "--fast-forward" in sys.argv and "--replay" in sys.argv
+# BYTED_DEV=1 reloads edited files in shaders/ while running
+dev = os.environ.get("BYTED_DEV") == "1"
+if headless:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# small buffer: sound effects start within ~12 ms
+pygame.mixer.pre_init(44100, -16, 2, 512)
 pygame.init()
 pygame.font.init()
 
-pygame.event.set_allowed([QUIT, KEYDOWN, KEYUP])
-window = pygame.display.set_mode((1200, 600), DOUBLEBUF | OPENGL)
-display = pygame.Surface((1200, 600))
-ctx = moderngl.create_context()
-pygame.display.set_caption("Byted Space Project")
-font = pygame.font.SysFont('Comic Sans MS', 20)
-big_font = pygame.font.SysFont('Comic Sans MS', 32)
-
-quad_buffer = ctx.buffer(data=array('f', [
-    # position (x, y), uv coords (x, y)
-    -1.0, 1.0, 0.0, 0.0,  # topleft
-    1.0, 1.0, 1.0, 0.0,  # topright
-    -1.0, -1.0, 0.0, 1.0,  # bottomleft
-    1.0, -1.0, 1.0, 1.0,  # bottomright
-]))
-
-program = ctx.program(vertex_shader="""
-#version 330 core
-
-in vec2 vert;
-in vec2 texcoord;
-out vec2 uvs;
-
-void main() {
-    uvs = texcoord;
-    gl_Position = vec4(vert, 0.0, 1.0);
-}
-""", fragment_shader="""
-#version 330 core
-
-uniform sampler2D tex;
-
-in vec2 uvs;
-out vec4 f_color;
-
-void main() {
-    vec2 sample_pos = vec2(uvs.x, uvs.y);
-    f_color = vec4(texture(tex, sample_pos).rg, texture(tex, sample_pos).b * 1.5, 1.0);
-}
-""")
-bloom = ctx.program(vertex_shader="""
-#version 330 core
-
-in vec2 vert;
-in vec2 texcoord;
-out vec2 uvs;
-
-void main() {
-    uvs = texcoord;
-    gl_Position = vec4(vert, 0.0, 1.0);
-}
-""", fragment_shader="""
-#version 330 core
-
-uniform sampler2D tex;
-uniform float threshold; // Threshold to determine bright areas
-uniform float bloomIntensity; // Intensity of the bloom effect
-uniform float blurRadius; // Radius of the blur
-
-in vec2 uvs;
-out vec4 f_color;
-
-// Function to calculate Gaussian blur
-vec4 gaussianBlur(sampler2D image, vec2 uv, vec2 resolution, float radius) {
-    vec4 color = vec4(0.0);
-    float totalWeight = 0.0;
-
-    // Gaussian kernel
-    for (float x = -radius; x <= radius; x++) {
-        for (float y = -radius; y <= radius; y++) {
-            vec2 offset = vec2(x, y) / resolution;
-            float weight = exp(-(offset.x * offset.x + offset.y * offset.y) * 4.0 * radius);
-            color += texture(image, uv + offset) * weight;
-            totalWeight += weight;
-        }
-    }
-
-    return color / totalWeight;
-}
-
-void main() {
-    // Sample the original image
-    vec4 originalColor = texture(tex, uvs);
-    
-    // Calculate the luminance of the pixel
-    float luminance = (originalColor.r + originalColor.g + originalColor.b) / 3.0;
-    
-    // Check if the pixel is bright enough
-    if (luminance > threshold) {
-        // Apply bloom effect to bright pixels
-        vec4 bloomColor = gaussianBlur(tex, uvs, textureSize(tex, 0), blurRadius) * bloomIntensity;
-        
-        // Add the bloom color to the original color
-        f_color = originalColor + bloomColor;
-    } else {
-        // Otherwise, just output the original color
-        f_color = originalColor;
-    }
-}
-""")
-
-render_object = ctx.vertex_array(program, [(quad_buffer, '2f 2f', 'vert', 'texcoord')])
-render_bloom = ctx.vertex_array(bloom, [(quad_buffer, '2f 2f', 'vert', 'texcoord')])
-
-
-def surf_to_texture(surf):
-    tex = ctx.texture(surf.get_size(), 4)
-    tex.filter = (moderngl.NEAREST, moderngl.NEAREST)
-    tex.swizzle = 'BGRA'
-    tex.write(surf.get_view('1'))
-    return tex
+pygame.event.set_allowed([QUIT, KEYDOWN, KEYUP, WINDOWFOCUSLOST, WINDOWFOCUSGAINED, WINDOWMINIMIZED, WINDOWRESTORED,
+                          WINDOWSHOWN, WINDOWHIDDEN])
 
 
 # Base values ------------------------------------
 config = {
     "path": {
         "textures": "textures",
+        "atlas_cache": os.path.join(".cache", "atlas"),
         "locales": "locales",
-        "settings": "settings.json"
+        "locale_cache": os.path.join(".cache", "locales"),
+        "settings": "settings.json",
+        "menus": "menus.json",
+        "sounds": "sounds",
+        "music": "music",
+        "profile": "profile.json"
+    },
+    # Loadout rules from todo.txt, the max values are reached through upgrades
+    "loadout": {
+        "slots": 5,
+        "max_slots": 8,
+        "dp": 3,
+        "unstable_slots": 1,
+        "max_unstable_slots": 3
+    },
+    # Reference server: python net.py serve
+    "server": {
+        "host": "127.0.0.1",
+        "port": 7777
     },
+    "audio": {
+        "channels": 24,
+        # copies of one sound playing at once, rapid fire restarts the oldest copy
+        "voices_per_sound": 4
+    },
+    # Texture groups (top-level directories in textures) loaded at startup, the rest load on first use
+    "critical_textures": ["other"],
     "default_settings": {
         "lang": "en_us",
         "fps": 60,
+        "vsync": False,
         "bloom": True,
+        "bloom_quality": "medium",
         "chromatic_aberration": True,
         "anti_aliasing": True,
         "other_distortion_effects": True,
         "screen_shake": 1.0,
         "music": 80,
         "sound": 100
+    },
+    # Checked on load, a value that is missing or doesn't fit is replaced by its default
+    "settings_schema": {
+        "lang": {"type": str},
+        "fps": {"type": int, "min": 0, "max": 240},
+        "vsync": {"type": bool},
+        "bloom": {"type": bool},
+        "bloom_quality": {"options": ["low", "medium", "high"]},
+        "chromatic_aberration": {"type": bool},
+        "anti_aliasing": {"type": bool},
+        "other_distortion_effects": {"type": bool},
+        "screen_shake": {"type": float, "min": 0.0, "max": 2.0},
+        "music": {"type": int, "min": 0, "max": 200},
+        "sound": {"type": int, "min": 0, "max": 200}
     }
 }
 
 
-def load_settings(path):
-    if os.path.exists(path):
-        with open(path, 'r') as file:
-            data = json.load(file)
-    else:
-        data = config["default_settings"]
-        with open(path, 'w') as file:
-            json.dump(data, file, indent=4)
-    return data
-
-
-def save_settings(data, path):
-    with open(path, 'w') as file:
-        json.dump(data, file, indent=4)
-
-
-settings = load_settings(config["path"]["settings"])
-
-tiles = {
-    1: "tiles.",
-    2: "tiles.",
-    3: "tiles.",
-    4: "tiles.",
-    5: "tiles.",
-    6: "tiles.",
-    7: "tiles.",
-    8: "tiles.",
-    9: "tiles.",
-    10: "tiles.",
-    11: "tiles.",
-    12: "tiles.",
-    13: "tiles.",
-    14: "tiles.",
-    15: "tiles.",
-    16: "tiles.",
-    17: "tiles."
-}
+settings_store = SettingsStore(config["path"]["settings"], config["default_settings"], config["settings_schema"])
+# the live dict, menus edit it in place and call settings_store.save()
+settings = settings_store.data
+
+
+# Window ------------------------------------
+# after the settings, vsync is chosen when the window is created
+vsync = False
+if headless:
+    window = pygame.display.set_mode((1200, 600))
+    ctx = create_headless_context(os.environ.get("BYTED_GL_BACKEND"))
+else:
+    try:
+        window = pygame.display.set_mode((1200, 600), DOUBLEBUF | OPENGL, vsync=int(settings["vsync"]))
+        vsync = settings["vsync"]
+    except pygame.error:
+        # the driver can't do vsync
+        window = pygame.display.set_mode((1200, 600), DOUBLEBUF | OPENGL)
+    ctx = moderngl.create_context()
+display = pygame.Surface((1200, 600))
+# a standalone context has no screen, headless frames go to an offscreen target and are never flipped
+screen_target = ctx.simple_framebuffer(display.get_size()) if headless else ctx.screen
+pygame.display.set_caption("Byted Space Project")
+font = pygame.font.SysFont('Comic Sans MS', 20)
+big_font = pygame.font.SysFont('Comic Sans MS', 32)
 
-modifiers = {
-    # Negative modifiers
-    "low_shield": {
-        "name": "modifier.low_shield",
-        "description": "modifier.low_shield.description",
-        "texture": "modifiers.low_shield",
-        "incompatible": ["high_shield"],
-        "action": "mul",
-        "effects": {
-            "shield": 0.5
-        },
-        "DP": -3
-    },
-    "low_health": {
-        "name": "modifier.low_health",
-        "description": "modifier.low_health.description",
-        "texture": "modifiers.low_health",
-        "incompatible": ["high_health"],
-        "action": "mul",
-        "effects": {
-            "health": 0.5
-        },
-        "DP": -3
-    },
-    "low_mobility": {
-        "name": "modifier.low_mobility",
-        "description": "modifier.low_mobility.description",
-        "texture": "modifiers.low_mobility",
-        "incompatible": ["high_mobility"],
-        "action": "mul",
-        "effects": {
-            "move_speed": 0.6,
-            "rotation_speed": 0.6
-        },
-        "DP": -3
-    },
-    "low_attack_speed": {
-        "name": "modifier.low_attack_speed",
-        "description": "modifier.low_attack_speed.description",
-        "texture": "modifiers.low_attack_speed",
-        "incompatible": ["high_attack_speed"],
-        "action": "mul",
-        "effects": {
-            "attack_speed": 0.6
-        },
-        "DP": -3
-    },
-    "low_damage": {
-        "name": "modifier.low_damage",
-        "description": "modifier.low_damage.description",
-        "texture": "modifiers.low_damage",
-        "incompatible": ["high_damage"],
-        "action": "mul",
-        "effects": {
-            "damage": 0.6
-        },
-        "DP": -3
-    },
-    "high_energy_usage": {
-        "name": "modifier.high_energy_usage",
-        "description": "modifier.high_energy_usage.description",
-        "texture": "modifiers.high_energy_usage",
-        "incompatible": ["low_energy_usage"],
-        "action": "mul",
-        "effects": {
-            "energy_usage": 1.5
-        },
-        "DP": -2
-    },
-    "low_projectile_speed": {
-        "name": "modifier.low_projectile_speed",
-        "description": "modifier.low_projectile_speed.description",
-        "texture": "modifiers.low_projectile_speed",
-        "incompatible": ["high_projectile_speed"],
-        "action": "mul",
-        "effects": {
-            "projectile_speed": 0.5
-        },
-        "DP": -2
-    },
-    "high_heating": {
-        "name": "modifier.high_heating",
-        "description": "modifier.high_heating.description",
-        "texture": "modifiers.high_heating",
-        "incompatible": ["low_heating"],
-        "action": "mul",
-        "effects": {
-            "heating": 1.5
-        },
-        "DP": -1
-    },
-    "low_laser_width": {
-        "name": "modifier.low_laser_width",
-        "description": "modifier.low_laser_width.description",
-        "texture": "modifiers.low_laser_width",
-        "incompatible": ["high_laser_width"],
-        "action": "mul",
-        "effects": {
-            "laser_width": 0.7
-        },
-        "DP": -1
-    },
-    # Unstable
-    "glass_cannon": {
-        "name": "modifier.glass_cannon",
-        "description": "modifier.glass_cannon.description",
-        "texture": "modifiers.glass_cannon",
-        "incompatible": [],
-        "action": "mul",
-        "effects": {
-            "damage": 2,
-            "damage_gain": 2
-        },
-        "DP": 0
-    },
-    "regeneration_swap": {
-        "name": "modifier.regeneration_swap",
-        "description": "modifier.regeneration_swap.description",
-        "texture": "modifiers.regeneration_swap",
-        "incompatible": [],
-        "action": "set",
-        "effects": {
-            "shield_regeneration": 0,
-            "health_regeneration": 1
-        },
-        "DP": 0
-    },
-    "acceleration": {
-        "name": "modifier.acceleration",
-        "description": "modifier.acceleration.description",
-        "texture": "modifiers.acceleration",
-        "incompatible": [],
-        "action": "mul",
-        "effects": {
-            "can_shoot_while_rotating": 0,
-            "movement_speed": 1.5
-        },
-        "DP": 0
-    },
-    "overclock": {
-        "name": "modifier.overclock",
-        "description": "modifier.overclock.description",
-        "texture": "modifiers.overclock",
-        "incompatible": [],
-        "action": "mul",
-        "effects": {
-            "heating": 3,
-            "overheat_duration": 1.5,
-            "attack_speed": 1.5
-        },
-        "DP": 0
-    },
-    # Positive modifiers
-    "high_shield": {
-        "name": "modifier.high_shield",
-        "description": "modifier.high_shield.description",
-        "texture": "modifiers.high_shield",
-        "incompatible": ["low_shield"],
-        "action": "mul",
-        "effects": {
-            "shield": 1.8
-        },
-        "DP": 3
-    },
-    "high_health": {
-        "name": "modifier.high_health",
-        "description": "modifier.high_health.description",
-        "texture": "modifiers.high_health",
-        "incompatible": ["low_health"],
-        "action": "mul",
-        "effects": {
-            "health": 1.8
-        },
-        "DP": 3
-    },
-    "high_mobility": {
-        "name": "modifier.high_mobility",
-        "description": "modifier.high_mobility.description",
-        "texture": "modifiers.high_mobility",
-        "incompatible": ["low_mobility"],
-        "action": "mul",
-        "effects": {
-            "move_speed": 1.5,
-            "rotation_speed": 1.5
-        },
-        "DP": 3
-    },
-    "high_attack_speed": {
-        "name": "modifier.high_attack_speed",
-        "description": "modifier.high_attack_speed.description",
-        "texture": "modifiers.high_attack_speed",
-        "incompatible": ["low_attack_speed"],
-        "action": "mul",
-        "effects": {
-            "attack_speed": 1.5
-        },
-        "DP": 3
-    },
-    "high_damage": {
-        "name": "modifier.high_damage",
-        "description": "modifier.high_damage.description",
-        "texture": "modifiers.high_damage",
-        "incompatible": ["low_damage"],
-        "action": "mul",
-        "effects": {
-            "damage": 1.5
-        },
-        "DP": 3
-    },
-    "low_energy_usage": {
-        "name": "modifier.low_energy_usage",
-        "description": "modifier.low_energy_usage.description",
-        "texture": "modifiers.low_energy_usage",
-        "incompatible": ["high_energy_usage"],
-        "action": "mul",
-        "effects": {
-            "energy_usage": 0.5
-        },
-        "DP": 2
-    },
-    "high_projectile_speed": {
-        "name": "modifier.high_projectile_speed",
-        "description": "modifier.high_projectile_speed.description",
-        "texture": "modifiers.high_projectile_speed",
-        "incompatible": ["low_projectile_speed"],
-        "action": "mul",
-        "effects": {
-            "projectile_speed": 1.5
-        },
-        "DP": 2
-    },
-    "low_heating": {
-        "name": "modifier.low_heating",
-        "description": "modifier.low_heating.description",
-        "texture": "modifiers.low_heating",
-        "incompatible": ["high_heating"],
-        "action": "mul",
-        "effects": {
-            "heating": 0.8
-        },
-        "DP": 1
-    },
-    "high_laser_width": {
-        "name": "modifier.high_laser_width",
-        "description": "modifier.high_laser_width.description",
-        "texture": "modifiers.high_laser_width",
-        "incompatible": ["low_laser_width"],
-        "action": "mul",
-        "effects": {
-            "laser_width": 1.2
-        },
-        "DP": 1
-    },
-}
+presenter = FramePresenter(ctx, display)
+text_renderer = TextRenderer()
 
 
 # Locales ------------------------------------
-def load_locales(directory):
-    loaded = {}
-    for filename in os.listdir(directory):
-        if filename.endswith('.json'):
-            locale_name = os.path.splitext(filename)[0]
-            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
-                data = json.load(file)
-                loaded[locale_name] = data
-    return loaded
-
-
-def get_translated(lang, path):
-    if lang in locales and path in locales[lang]:
-        return locales[lang][path]
-    else:
-        return "404"
+def get_translated(path):
+    return localization.translate(path)
+
 
+# Textures ------------------------------------
+def get_texture(path):
+    return textures.get(path)
+
+
+# Profiler ------------------------------------
+class Profiler:
+    # Per-frame stage timings in a ring buffer of the last `capacity` frames. CPU stages are timed
+    # with perf_counter, GPU stages with timer queries; a query is read back one frame later so
+    # the readback doesn't stall the pipeline.
+    def __init__(self, context, capacity=600):
+        self.ctx = context
+        self.enabled = False
+        self.overlay = False
+        self.frames = deque(maxlen=capacity)
+        self.current = {}
+        self.queries = {}
+        self.pending = {}
+        self.frame_start = None
+        self.overlay_lines = []
+        self.overlay_refresh = 0.0
+        # one-off timings in ms, e.g. startup stages
+        self.marks = {}
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.enabled or self.overlay
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self.current[name] = self.current.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @contextmanager
+    def gpu_stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        name = "gpu." + name
+        if name not in self.queries:
+            self.queries[name] = [self.ctx.query(time=True), self.ctx.query(time=True), 0]
+        queries = self.queries[name]
+        with queries[queries[2] % 2]:
+            yield
+        queries[2] += 1
+        if queries[2] > 1:
+            # the other query holds this stage's result from the previous frame
+            self.pending[name] = queries[queries[2] % 2]
+
+    def begin_frame(self):
+        now = time.perf_counter()
+        if self.enabled and self.frame_start is not None:
+            for name, query in self.pending.items():
+                self.current[name] = query.elapsed / 1000000
+            self.current["frame"] = (now - self.frame_start) * 1000
+            self.frames.append(self.current)
+        self.current = {}
+        self.pending = {}
+        self.frame_start = now
+
+    def percentiles(self, name="frame", points=(50, 95, 99)):
+        values = sorted(frame[name] for frame in self.frames if name in frame)
+        if not values:
+            return [0.0 for _ in points]
+        return [values[min(len(values) - 1, int(len(values) * p / 100))] for p in points]
+
+    def stage_names(self):
+        names = []
+        for frame in self.frames:
+            for name in frame:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def render_overlay(self, x, y):
+        if not self.overlay:
+            return
+        now = time.perf_counter()
+        if now - self.overlay_refresh > 0.5:
+            self.overlay_refresh = now
+            p50, p95, p99 = self.percentiles()
+            self.overlay_lines = ["frame  p50 %.2f  p95 %.2f  p99 %.2f ms" % (p50, p95, p99)]
+            for name in self.stage_names():
+                if name != "frame":
+                    self.overlay_lines.append("%s  %.2f ms" % (name, self.percentiles(name, (50,))[0]))
+        for i, line in enumerate(self.overlay_lines):
+            presenter.blit(text_renderer.render(font, line, False, (0, 255, 0)), (x, y + i * 20))
+
+    def dump(self, path):
+        names = self.stage_names()
+        if path.endswith(".csv"):
+            with open(path, 'w') as file:
+                file.write(",".join(names) + "\n")
+                for frame in self.frames:
+                    file.write(",".join("%.4f" % frame.get(name, 0.0) for name in names) + "\n")
+        else:
+            with open(path, 'w') as file:
+                json.dump({
+                    "percentiles": {name: dict(zip(("p50", "p95", "p99"), self.percentiles(name)))
+                                    for name in names},
+                    "marks": self.marks,
+                    "frames": list(self.frames)
+                }, file, indent=4)
+
+
+profiler = Profiler(ctx)
 
-locales = load_locales(config["path"]["locales"])
 
+# Menu ------------------------------------
+class MenuItem:
+    # One row of a menu screen, built from its definition in menus.json. `row` is the y offset of the
+    # row, fixed when the menu is loaded. Items with arrows draw "< value >" and are changed with
+    # a/d through change(), which returns True when it changed a setting.
+    arrows = False
+    # value() can change without input (e.g. connection status), the menu polls it in update()
+    live = False
 
-# Textures ------------------------------------
-def load_textures(directory):
-    loaded = {}
+    def __init__(self, definition, row):
+        self.name = definition["name"]
+        self.target = definition.get("target")
+        self.row = row
+        self.drawn = None
 
-    empty_texture = pygame.Surface((32, 32))
-    empty_texture.fill((0, 0, 0))
-    loaded['__empty__'] = empty_texture
+    def value(self):
+        return None
 
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.png'):
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, directory)
-                relative_path = relative_path.replace(os.path.sep, '.')
-                texture_key = os.path.splitext(relative_path)[0]
-                texture = pygame.image.load(file_path).convert_alpha()
-                loaded[texture_key] = texture
+    def apply(self, menu):
+        pass
 
-    return loaded
+    def change(self, direction):
+        return False
 
 
-def get_texture(path):
-    if path in textures:
-        return textures[path]
-    else:
-        return textures['__empty__']
+class GotoItem(MenuItem):
+    def __init__(self, definition, row):
+        super().__init__(definition, row)
+        self.goto = definition["goto"]
+        self.save = definition["action"] == "goto&save"
 
+    def apply(self, menu):
+        if self.save:
+            settings_store.save()
+        menu.open(self.goto)
 
-textures = load_textures(config["path"]["textures"])
+
+class QuitItem(MenuItem):
+    def apply(self, menu):
+        global running
+        running = False
+
+
+class ConnectItem(MenuItem):
+    live = True
+
+    def value(self):
+        return get_translated("menu.play.status." + net_client.status)
+
+    def apply(self, menu):
+        net_client.connect(config["server"]["host"], config["server"]["port"])
+
+
+class LanguageItem(MenuItem):
+    arrows = True
+
+    def __init__(self, definition, row):
+        super().__init__(definition, row)
+        self.target = "lang"
+
+    def value(self):
+        return get_translated("__name__")
+
+    def change(self, direction):
+        languages = localization.languages
+        settings["lang"] = languages[(languages.index(localization.language) + direction) % len(languages)]
+        localization.set_language(settings["lang"])
+        return True
+
+
+class SwitchItem(MenuItem):
+    arrows = True
+
+    def value(self):
+        return get_translated("menu.enabled" if settings[self.target] else "menu.disabled")
+
+    def change(self, direction):
+        settings[self.target] = not settings[self.target]
+        return True
+
+
+class SelectItem(MenuItem):
+    arrows = True
+
+    def __init__(self, definition, row):
+        super().__init__(definition, row)
+        self.options = definition["options"]
+        self.labels = definition.get("labels", "")
+
+    def value(self):
+        return get_translated(self.labels + settings[self.target])
+
+    def change(self, direction):
+        i = self.options.index(settings[self.target]) if settings[self.target] in self.options else 0
+        settings[self.target] = self.options[(i + direction) % len(self.options)]
+        return True
+
+
+class EditItem(MenuItem):
+    arrows = True
+
+    def __init__(self, definition, row):
+        super().__init__(definition, row)
+        self.min = definition["min"]
+        self.max = definition["max"]
+        self.step = definition["step"]
+        # shown with as many decimals as the step has
+        self.decimals = len(repr(self.step).split(".")[1]) if isinstance(self.step, float) else 0
+        # label shown instead of 0 (fps 0 = uncapped)
+        self.zero = definition.get("zero")
+
+    def value(self):
+        if self.zero is not None and settings[self.target] == 0:
+            return get_translated(self.zero)
+        return "%.*f" % (self.decimals, settings[self.target])
+
+    def change(self, direction):
+        value = min(max(settings[self.target] + direction * self.step, self.min), self.max)
+        value = round(value, self.decimals) if self.decimals else int(round(value))
+        if value == settings[self.target]:
+            return False
+        settings[self.target] = value
+        return True
 
 
-# Menu ------------------------------------
 class Menu:
-    def __init__(self):
+    # Screens come from menus.json and are compiled once into item objects with their rows laid out.
+    # The static part (title, labels, values) is drawn into its own surface only when something
+    # changed: input, a setting, the language or a live value. Other frames only move the pointer,
+    # restoring the pixels under its previous position from that surface.
+    item_types = {
+        "-": MenuItem,
+        "goto": GotoItem,
+        "goto&save": GotoItem,
+        "quit": QuitItem,
+        "connect": ConnectItem,
+        "language": LanguageItem,
+        "switch": SwitchItem,
+        "select": SelectItem,
+        "edit": EditItem
+    }
+
+    def __init__(self, path, x, y):
+        self.x = x
+        self.y = y
         self.sin_i = 0
+        self.previous_sin_i = 0
         self.selected = 0
         self.dynamic_cursor_y = 0
+        self.previous_cursor_y = 0
         self.pointer_texture = get_texture("other.pointer")
+        self.pointer_rect = None
+        self.static = pygame.Surface(display.get_size())
+        self.dirty = True
         self.current_menu = "main"
-        self.menus = {
-            "main": {
-                "name": "game.name",
-                0: {
-                    "name": "menu.play",
-                    "action": "goto",
-                    "goto": "play"
-                },
-                1: {
-                    "name": "menu.options",
-                    "action": "goto",
-                    "goto": "options"
-                },
-                2: {
-                    "name": "menu.quit",
-                    "action": "quit"
-                }
-            },
-            "options": {
-                "name": "menu.options",
-                0: {
-                    "name": "menu.back",
-                    "action": "goto&save",
-                    "goto": "main"
-                },
-                1: {
-                    "name": "menu.options.music",
-                    "action": "edit",
-                    "min": 0,
-                    "max": 200,
-                    "step": 1,
-                    "target": "music"
-                },
-                2: {
-                    "name": "menu.options.sounds",
-                    "action": "edit",
-                    "min": 0,
-                    "max": 200,
-                    "step": 1,
-                    "target": "sounds"
-                },
-                3: {
-                    "name": "menu.options.language",
-                    "action": "language"
-                },
-                4: {
-                    "name": "menu.options.fps",
-                    "action": "edit",
-                    "min": 30,
-                    "max": 240,
-                    "step": 30,
-                    "target": "sounds"
-                },
-                5: {
-                    "name": "menu.options.bloom",
-                    "action": "switch",
-                    "target": "bloom"
-                },
-                6: {
-                    "name": "menu.options.chromatic_aberration",
-                    "action": "switch",
-                    "target": "chromatic_aberration"
-                },
-                7: {
-                    "name": "menu.options.anti_aliasing",
-                    "action": "switch",
-                    "target": "anti_aliasing"
-                },
-                8: {
-                    "name": "menu.options.other_distortion_effects",
-                    "action": "switch",
-                    "target": "other_distortion_effects"
-                },
-                9: {
-                    "name": "menu.options.screen_shake",
-                    "action": "edit",
-                    "min": 0.0,
-                    "max": 2.0,
-                    "step": 0.1,
-                    "target": "screen_shake"
-                }
-            },
-            "play": {
-                "name": "menu.play",
-                0: {
-                    "name": "menu.back",
-                    "action": "goto",
-                    "goto": "main"
-                },
-                1: {
-                    "name": "menu.play.connect",
-                    "action": "-"
-                }
-            }
-        }
+        self.menus = self.load(path)
+
+    def load(self, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            definitions = json.load(file)
+        return {name: {
+            "name": definition["name"],
+            "items": [self.item_types[item["action"]](item, 50 + i * 30) for i, item in enumerate(definition["items"])]
+        } for name, definition in definitions.items()}
+
+    @property
+    def items(self):
+        return self.menus[self.current_menu]["items"]
+
+    def open(self, name):
+        self.current_menu = name
+        self.selected = 0
+        self.dirty = True
+
+    def changed(self, target):
+        if target in ("lang", "anti_aliasing"):
+            text_renderer.invalidate()
+        if target in ("music", "sound"):
+            audio.set_volumes(settings)
+        post_process.build(frame_governor.effective(settings))
+        settings_store.save()
+        self.dirty = True
 
     def update(self):
+        self.previous_sin_i = self.sin_i
+        self.previous_cursor_y = self.dynamic_cursor_y
         self.sin_i += 0.05
-        if self.sin_i >= 360:
-            self.sin_i -= 360
-        self.dynamic_cursor_y = linear_interpolation(self.dynamic_cursor_y, self.selected * 30 + 58, 0.1)
-
-    def render(self, x, y):
-        display.blit(self.pointer_texture, (x + (math.sin(self.sin_i) * 5), y + self.dynamic_cursor_y))
-        for i in range(len(self.menus[self.current_menu]) - 1):
-            c = (255, 255, 255)
-            if i == self.selected:
-                c = (255, 255, 0)
-            display.blit(
-                font.render(get_translated(settings["lang"], self.menus[self.current_menu][i]["name"]),
-                            settings["anti_aliasing"], c), (x + 30, y + 50 + (i * 30)))
-            if self.menus[self.current_menu][i]["action"] in ("edit", "switch", "language"):
-                display.blit(font.render("<", settings["anti_aliasing"], c), (x + 500, y + 50 + (i * 30)))
-                display.blit(font.render(">", settings["anti_aliasing"], c), (x + 700, y + 50 + (i * 30)))
-                if self.menus[self.current_menu][i]["action"] == "language":
-                    text_width, text_height = font.size(get_translated(settings["lang"], "__name__"))
-                    display.blit(
-                        font.render(get_translated(settings["lang"], "__name__"), settings["anti_aliasing"], c),
-                        (x + 600 - (text_width / 2), y + 50 + (i * 30)))
-                if self.menus[self.current_menu][i]["action"] == "switch":
-                    a = {True: "menu.enabled", False: "menu.disabled"}[
-                        settings[self.menus[self.current_menu][i]["target"]]]
-                    text_width, text_height = font.size(get_translated(settings["lang"], a))
-                    display.blit(font.render(get_translated(settings["lang"], a), settings["anti_aliasing"], c),
-                                 (x + 600 - (text_width / 2), y + 50 + (i * 30)))
+        if self.sin_i >= math.tau:
+            self.sin_i -= math.tau
+            self.previous_sin_i -= math.tau
+        self.dynamic_cursor_y = linear_interpolation(self.dynamic_cursor_y, self.items[self.selected].row + 8, 0.1)
+        for item in self.items:
+            if item.live and item.value() != item.drawn:
+                self.dirty = True
+
+    def redraw(self):
+        antialias = settings["anti_aliasing"]
+        self.static.fill((10, 10, 10))
         if self.menus[self.current_menu]["name"] is not None:
-            display.blit(
-                big_font.render(get_translated(settings["lang"], self.menus[self.current_menu]["name"]),
-                                settings["anti_aliasing"], (255, 255, 255)), (x, y))
+            self.static.blit(text_renderer.render(big_font, get_translated(self.menus[self.current_menu]["name"]),
+                                                  antialias, (255, 255, 255)), (self.x, self.y))
+        for i, item in enumerate(self.items):
+            c = (255, 255, 0) if i == self.selected else (255, 255, 255)
+            y = self.y + item.row
+            self.static.blit(text_renderer.render(font, get_translated(item.name), antialias, c), (self.x + 30, y))
+            if item.arrows:
+                self.static.blit(text_renderer.render(font, "<", antialias, c), (self.x + 500, y))
+                self.static.blit(text_renderer.render(font, ">", antialias, c), (self.x + 700, y))
+            item.drawn = item.value()
+            if item.drawn is not None:
+                text = text_renderer.render(font, item.drawn, antialias, c)
+                self.static.blit(text, (self.x + 600 - (text.get_width() / 2), y))
+        presenter.blit(self.static, (0, 0))
+        self.pointer_rect = None
+        self.dirty = False
+
+    def render(self, alpha=1.0):
+        if self.dirty:
+            self.redraw()
+        sin_i = linear_interpolation(self.previous_sin_i, self.sin_i, alpha)
+        cursor_y = linear_interpolation(self.previous_cursor_y, self.dynamic_cursor_y, alpha)
+        if self.pointer_rect is not None:
+            presenter.blit(self.static, self.pointer_rect.topleft, self.pointer_rect)
+        self.pointer_rect = presenter.blit(self.pointer_texture, (self.x + (math.sin(sin_i) * 5), self.y + cursor_y))
 
     def up(self):
-        self.selected -= 1
-        if self.selected < 0:
-            self.selected = len(self.menus[self.current_menu]) - 2
+        self.selected = (self.selected - 1) % len(self.items)
+        self.dirty = True
+        audio.play("menu.move", priority=2)
 
     def down(self):
-        self.selected += 1
-        if self.selected > len(self.menus[self.current_menu]) - 2:
-            self.selected = 0
+        self.selected = (self.selected + 1) % len(self.items)
+        self.dirty = True
+        audio.play("menu.move", priority=2)
 
     def apply(self):
-        global running
-        if self.menus[self.current_menu][self.selected]["action"] == "goto":
-            self.current_menu = self.menus[self.current_menu][self.selected]["goto"]
-            self.selected = 0
-        elif self.menus[self.current_menu][self.selected]["action"] == "goto&save":
-            self.current_menu = self.menus[self.current_menu][self.selected]["goto"]
-            save_settings(settings, config["path"]["settings"])
-            self.selected = 0
-        elif self.menus[self.current_menu][self.selected]["action"] == "quit":
-            running = False
+        audio.play("menu.apply", priority=2)
+        self.items[self.selected].apply(self)
+        self.dirty = True
 
     def next(self):
-        global settings
-        if self.menus[self.current_menu][self.selected]["action"] == "language":
-            i = list(locales.keys()).index(settings["lang"]) + 1
-            if i > len(locales) - 1:
-                i = 0
-            settings["lang"] = list(locales.keys())[i]
-        elif self.menus[self.current_menu][self.selected]["action"] == "switch":
-            settings[self.menus[self.current_menu][self.selected]["target"]] = not settings[
-                self.menus[self.current_menu][self.selected]["target"]]
+        if self.items[self.selected].change(1):
+            self.changed(self.items[self.selected].target)
 
     def previous(self):
-        global settings
-        if self.menus[self.current_menu][self.selected]["action"] == "language":
-            settings["lang"] = list(locales.keys())[list(locales.keys()).index(settings["lang"]) - 1]
-        elif self.menus[self.current_menu][self.selected]["action"] == "switch":
-            settings[self.menus[self.current_menu][self.selected]["target"]] = not settings[
-                self.menus[self.current_menu][self.selected]["target"]]
+        if self.items[self.selected].change(-1):
+            self.changed(self.items[self.selected].target)
+
+
+# Input ------------------------------------
+class InputQueue:
+    # Key events are not dispatched straight from pygame.event.get(): they wait here for the start of
+    # the next simulation tick and are handed out stamped with it. While recording every event also
+    # goes into the log, while replaying the events come from the log and the keyboard is ignored.
+    recorded_types = (KEYDOWN, KEYUP)
+
+    def __init__(self):
+        self.pending = []
+        self.tick = 0
+        self.recording = None
+        self.replay = None
+
+    def push(self, event):
+        if self.replay is None and event.type in self.recorded_types:
+            self.pending.append((event.type, event.key))
+
+    def take(self):
+        if self.replay is not None:
+            events = self.replay.take(self.tick)
+        else:
+            events, self.pending = self.pending, []
+            if self.recording is not None:
+                for event_type, key in events:
+                    self.recording.add(self.tick, event_type, key)
+        self.tick += 1
+        return events
+
+    @property
+    def finished(self):
+        return self.replay is not None and self.replay.finished and self.tick >= self.replay.ticks
+
+    def save_recording(self, path):
+        self.recording.ticks = self.tick
+        self.recording.save(path)
+
+
+def handle_input(event_type, key):
+    if event_type == KEYDOWN:
+        if key == K_w:
+            menu.up()
+        elif key == K_s:
+            menu.down()
+        elif key == K_a:
+            menu.previous()
+        elif key == K_d:
+            menu.next()
+        elif key == K_RETURN:
+            menu.apply()
+
+
+def simulate_tick():
+    for event_type, key in input_queue.take():
+        handle_input(event_type, key)
+    if screen == "menu":
+        menu.update()
+    post_process.update()
+    particles.update(game_loop.tick_time)
+
+
+def fast_forward():
+    # Runs the replay without rendering, as fast as it goes
+    start = time.perf_counter()
+    while running and not input_queue.finished:
+        profiler.begin_frame()
+        with profiler.stage("update"):
+            simulate_tick()
+    elapsed = time.perf_counter() - start
+    print("%d ticks in %.2f s, %.0f ticks/s (%.1fx real time)" % (
+        input_queue.tick, elapsed, input_queue.tick / max(elapsed, 1e-9),
+        input_queue.tick * game_loop.tick_time / max(elapsed, 1e-9)))
+
+
+# Game loop ------------------------------------
+class GameLoop:
+    # Runs the simulation at a fixed tick rate independent of the render rate. Each frame
+    # advance() returns how many ticks to simulate and alpha says how far the frame is between
+    # the previous and the current tick, for interpolating what is drawn. max_ticks is how many ticks
+    # of backlog it catches up on top of the ticks a frame at the current frame rate is due.
+    def __init__(self, tick_rate=60, max_ticks=5):
+        self.tick_rate = tick_rate
+        self.tick_time = 1 / tick_rate
+        self.max_ticks = max_ticks
+        self.accumulator = 0.0
+        self.last_time = time.perf_counter()
+        self.ticks = 0
+
+    def advance(self, fps=0):
+        # fps: what frames are limited to right now (0 uncapped), a throttled background window
+        # is due many ticks per frame without being behind
+        now = time.perf_counter()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        ticks = int(self.accumulator / self.tick_time)
+        max_ticks = self.max_ticks + (math.ceil(self.tick_rate / fps) if fps > 0 else 0)
+        if ticks > max_ticks:
+            # Too far behind (window dragged, long hitch): drop the backlog instead of spiraling
+            ticks = max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= ticks * self.tick_time
+        self.ticks += ticks
+        return ticks
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.tick_time, 1.0)
+
+
+def limit_frame_rate(clock, fps):
+    # fps 0 means uncapped
+    if fps > 0:
+        clock.tick(fps)
+    else:
+        clock.tick()
+
+
+class FrameGovernor:
+    # Frame rate by window state: full rate when focused, background_fps when the window lost focus,
+    # and no rendering at all (events only, at minimized_fps) while minimized or hidden.
+    # While focused it also watches how long frames take and steps through `levels` when they run
+    # over budget, back towards the user's settings after a while with headroom. Levels only ever
+    # lower what the user picked. With vsync the flip is left out of the frame time (its wait, like
+    # the frame limiter's sleep, isn't work lower quality would save), without it the flip counts,
+    # it is where a GPU-bound frame blocks.
+    levels = [
+        {},
+        {"bloom_quality": "low"},
+        {"bloom": False},
+        {"bloom": False, "chromatic_aberration": False, "other_distortion_effects": False},
+        {"bloom": False, "chromatic_aberration": False, "other_distortion_effects": False, "render_scale": 0.75},
+        {"bloom": False, "chromatic_aberration": False, "other_distortion_effects": False, "render_scale": 0.5}
+    ]
+    bloom_quality_order = ["low", "medium", "high"]
+
+    def __init__(self, background_fps=10, minimized_fps=2, over_budget=1.15, under_budget=0.6,
+                 frames_to_lower=30, frames_to_raise=240):
+        self.background_fps = background_fps
+        self.minimized_fps = minimized_fps
+        self.over_budget = over_budget
+        self.under_budget = under_budget
+        self.frames_to_lower = frames_to_lower
+        self.frames_to_raise = frames_to_raise
+        self.focused = True
+        self.minimized = False
+        self.level = 0
+        self.frame_ms = 0.0
+        self.over = 0
+        self.under = 0
+
+    def handle(self, event):
+        if event.type == WINDOWFOCUSLOST:
+            self.focused = False
+        elif event.type == WINDOWFOCUSGAINED:
+            self.focused = True
+        elif event.type in (WINDOWMINIMIZED, WINDOWHIDDEN):
+            self.minimized = True
+        elif event.type in (WINDOWRESTORED, WINDOWSHOWN):
+            self.minimized = False
+
+    def should_render(self):
+        return not self.minimized
+
+    def fps(self, settings):
+        if self.minimized:
+            return self.minimized_fps
+        if not self.focused:
+            return self.background_fps
+        return settings["fps"]
+
+    def effective(self, settings):
+        # The user's settings with the current quality level applied
+        overrides = self.levels[self.level]
+        effective = dict(settings)
+        if "bloom_quality" in overrides and settings["bloom_quality"] in self.bloom_quality_order:
+            effective["bloom_quality"] = min(settings["bloom_quality"], overrides["bloom_quality"],
+                                             key=self.bloom_quality_order.index)
+        for name in ("bloom", "chromatic_aberration", "other_distortion_effects"):
+            if name in overrides:
+                effective[name] = settings[name] and overrides[name]
+        effective["render_scale"] = overrides.get("render_scale", 1.0)
+        return effective
+
+    def record(self, frame_ms, settings):
+        # Returns True when the quality level changed and the post processing has to be rebuilt
+        if not self.focused or self.minimized:
+            self.over = self.under = 0
+            return False
+        self.frame_ms = frame_ms if self.frame_ms == 0 else self.frame_ms * 0.9 + frame_ms * 0.1
+        budget = 1000 / (settings["fps"] if settings["fps"] > 0 else 60)
+        self.over = self.over + 1 if self.frame_ms > budget * self.over_budget else 0
+        self.under = self.under + 1 if self.frame_ms < budget * self.under_budget else 0
+        if self.over >= self.frames_to_lower and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif self.under >= self.frames_to_raise and self.level > 0:
+            self.level -= 1
+        else:
+            return False
+        self.over = self.under = 0
+        return True
+
+
+# Bootstrap ------------------------------------
+def load_localization():
+    global localization
+    localization = Localization(config["path"]["locales"], config["path"]["locale_cache"])
+    localization.set_language(settings["lang"])
+    localization.translate("__name__")
+
+
+def load_stats():
+    global stat_engine, loadout_rules
+    stat_engine = StatEngine(modifiers, ship_stats)
+    loadout_rules = LoadoutRules(modifiers)
+
+
+def warm_kernels():
+    # loads (or on the very first run compiles) the numba kernels before anything needs them
+    for args in ((0, 0, 0.1), (0.0, 0, 0.1), (0, 0.0, 0.1), (0.0, 0.0, 0.1)):
+        linear_interpolation(*args)
+    warm_client()
+
+
+def scan_textures():
+    global textures
+    # decoding of the critical groups starts on the texture store's threads
+    textures = TextureStore(config["path"]["textures"], config["path"]["atlas_cache"], critical=())
+    for group in config["critical_textures"]:
+        textures.prefetch(group)
+
+
+def load_critical_textures():
+    for group in config["critical_textures"]:
+        if group in textures.sources:
+            textures.load_group(group)
+
+
+def build_post_process():
+    global post_process
+    post_process = PostProcess(ctx, display.get_size(), profiler)
+    post_process.build(frame_governor.effective(settings))
+
+
+def build_renderers():
+    global sprites, tile_renderer, particles
+    sprites = SpriteBatch(ctx, textures, display.get_size())
+    # draws nothing until a map is set with tile_renderer.set_map(TileMap.load(...))
+    tile_renderer = TileMapRenderer(ctx, textures, tiles, display.get_size())
+    # engine trails, explosions, overheating: particles.emit("explosion", x, y) / emit_many(...)
+    particles = ParticleSystem(ctx, display.get_size())
+
+
+def load_audio():
+    global audio
+    audio = AudioMixer(config["path"]["sounds"], config["path"]["music"], **config["audio"])
+    audio.load_sounds()
+    audio.set_volumes(settings)
+
+
+def reload_shaders():
+    if not get_shaders(ctx).reload():
+        return
+    post_process.release()
+    post_process.build(frame_governor.effective(settings))
+    for renderer in (sprites, tile_renderer, particles):
+        renderer.reload_shaders()
+
+
+def build_menu():
+    global net_client, menu
+    net_client = NetClient()
+    menu = Menu(config["path"]["menus"], 100, 100)
+
+
+class Bootstrap:
+    # Startup in stages. Background stages (pure Python/numpy/numba) run in order on one thread,
+    # main stages (pygame surfaces, GL objects) run one per call to step(), so the game can show a
+    # loading screen between them. Weights only drive the progress bar.
+    def __init__(self, background, main):
+        self.background = background
+        self.main = list(main)
+        self.total = sum(weight for _, _, weight in background + main)
+        self.done = 0
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run_background, name="bootstrap", daemon=True)
+        self.thread.start()
+
+    def run_background(self):
+        try:
+            for name, stage, weight in self.background:
+                self.run_stage(name, stage, weight)
+        except BaseException as error:
+            self.error = error
+
+    def run_stage(self, name, stage, weight):
+        start = time.perf_counter()
+        stage()
+        profiler.marks["startup." + name] = (time.perf_counter() - start) * 1000
+        self.done += weight
+
+    def step(self):
+        # Returns True once everything is loaded
+        if self.error is not None:
+            raise self.error
+        if self.main:
+            self.run_stage(*self.main.pop(0))
+            return False
+        return not self.thread.is_alive()
+
+    def run(self):
+        # Everything on the calling thread. While main.py is being imported the loading thread can
+        # deadlock on the import lock (numba's cache looks the module up), so imports use this.
+        for stage in self.background + self.main:
+            self.run_stage(*stage)
+        self.main = []
+
+    @property
+    def progress(self):
+        return self.done / self.total
+
+
+def render_loading_screen(copy_pass, progress):
+    display.fill((10, 10, 10))
+    title = text_renderer.render(big_font, "Byted Space Project", True, (255, 255, 255))
+    presenter.blit(title, (600 - title.get_width() / 2, 250))
+    pygame.draw.rect(display, (60, 60, 60), (400, 320, 400, 8))
+    pygame.draw.rect(display, (255, 255, 0), (400, 320, int(400 * progress), 8))
+    presenter.invalidate()
+    copy_pass.render(presenter.present(), screen_target)
+    if not headless:
+        pygame.display.flip()
 
 
 # Init ------------------------------------
 clock = pygame.time.Clock()
+frame_governor = FrameGovernor()
 screen = "menu"
-menu = Menu()
+game_loop = GameLoop(60)
+input_queue = InputQueue()
+bootstrap = Bootstrap(
+    background=[("localization", load_localization, 1), ("stats", load_stats, 1), ("kernels", warm_kernels, 4)],
+    main=[("textures.scan", scan_textures, 1), ("post_process", build_post_process, 2),
+          ("renderers", build_renderers, 2), ("textures.critical", load_critical_textures, 2),
+          ("audio", load_audio, 1), ("menu", build_menu, 1)]
+)
+if __name__ != "__main__":
+    # imported (bench.py, tools): load everything up front
+    bootstrap.run()
 if __name__ == "__main__":
-    running = True
+    # --profile [file], a .csv file gets one row per frame, anything else the JSON summary
+    profiler.enabled = "--profile" in sys.argv
+    profile_path = config["path"]["profile"]
+    if profiler.enabled:
+        following = sys.argv[sys.argv.index("--profile") + 1:]
+        if following and not following[0].startswith("--"):
+            profile_path = following[0]
+    # --record <file> logs the session's input, --replay <file> plays one back (on top of the
+    # settings it was recorded with, which are not saved), adding --fast-forward runs it unrendered
+    if "--replay" in sys.argv:
+        input_queue.replay = InputLog.load(sys.argv[sys.argv.index("--replay") + 1])
+        settings.update(input_queue.replay.settings)
+        settings_store.persist = False
+    elif "--record" in sys.argv:
+        input_queue.recording = InputLog(game_loop.tick_rate, dict(settings))
+    if input_queue.replay is not None and "--fast-forward" in sys.argv:
+        # nothing is shown, load everything and run the replay as fast as it goes
+        bootstrap.run()
+        running = True
+        fast_forward()
+        running = False
+    else:
+        # the loading screen only needs a copy shader, everything else is built while it shows
+        loading_pass = FusedPass(ctx, [])
+        bootstrap.start()
+        render_loading_screen(loading_pass, 0.0)
+        profiler.marks["startup.first_frame"] = (time.perf_counter() - launch_time) * 1000
+        while not bootstrap.step():
+            for event in pygame.event.get():
+                frame_governor.handle(event)
+                if event.type == QUIT:
+                    pygame.quit()
+                    sys.exit()
+            render_loading_screen(loading_pass, bootstrap.progress)
+            limit_frame_rate(clock, 60)
+        loading_pass.release()
+        profiler.marks["startup.ready"] = (time.perf_counter() - launch_time) * 1000
+        if profiler.enabled:
+            print("time to first frame %.1f ms, ready after %.1f ms" % (profiler.marks["startup.first_frame"],
+                                                                       profiler.marks["startup.ready"]))
+        game_loop.last_time = time.perf_counter()
+        running = True
+    shaders_checked = time.perf_counter()
     while running:
-        for event in pygame.event.get():
-            if event.type == QUIT:
+        profiler.begin_frame()
+        frame_start = time.perf_counter()
+        with profiler.stage("events"):
+            for event in pygame.event.get():
+                frame_governor.handle(event)
+                if event.type == QUIT:
+                    running = False
+                elif event.type == KEYDOWN and event.key == K_F3:
+                    profiler.toggle_overlay()
+                    if not profiler.overlay:
+                        # nothing draws over the overlay's last frame, redraw and upload the whole screen
+                        menu.dirty = True
+                        presenter.invalidate()
+                else:
+                    input_queue.push(event)
+        with profiler.stage("update"):
+            for _ in range(game_loop.advance(frame_governor.fps(settings))):
+                simulate_tick()
+            if input_queue.finished:
                 running = False
-            elif event.type == KEYDOWN:
-                if event.key == K_w:
-                    menu.up()
-                elif event.key == K_s:
-                    menu.down()
-                elif event.key == K_a:
-                    menu.previous()
-                elif event.key == K_d:
-                    menu.next()
-                elif event.key == K_RETURN:
-                    menu.apply()
-        if screen == "menu":
-            menu.update()
-        display.fill((10, 10, 10))
-        if screen == "menu":
-            menu.render(100, 100)
-
-        frame_tex = surf_to_texture(display)
-        frame_tex.use(0)
-        program['tex'] = 0
-        render_object.render(mode=moderngl.TRIANGLE_STRIP)
-        if settings["bloom"]:
-            bloom["threshold"] = 0.0
-            bloom["bloomIntensity"] = 0.8
-            bloom["blurRadius"] = 5.0
-            render_bloom.render(mode=moderngl.TRIANGLE_STRIP)
-
-        pygame.display.flip()
-        frame_tex.release()
-        clock.tick(60)
-
+            if dev and frame_start - shaders_checked > 0.5:
+                shaders_checked = frame_start
+                reload_shaders()
+        if frame_governor.should_render():
+            with profiler.stage("render"):
+                if screen == "menu":
+                    # the overlay is drawn over the menu's static surface, which has to be redrawn under it
+                    if profiler.overlay:
+                        menu.dirty = True
+                    menu.render(game_loop.alpha)
+                profiler.render_overlay(900, 10)
+
+            with profiler.stage("upload"):
+                frame_tex = presenter.present()
+            with profiler.stage("sprites"), profiler.gpu_stage("SpriteBatch"):
+                sprite_layer = sprites.render(tile_renderer if tile_renderer.map is not None else None,
+                                              particles if particles.live else None)
+            with profiler.stage("post_process"):
+                post_process.render(frame_tex, screen_target, sprite_layer)
+            frame_ms = (time.perf_counter() - frame_start) * 1000
+
+            if not headless:
+                with profiler.stage("flip"):
+                    pygame.display.flip()
+                if not vsync:
+                    frame_ms = (time.perf_counter() - frame_start) * 1000
+            if frame_governor.record(frame_ms, settings):
+                post_process.build(frame_governor.effective(settings))
+        with profiler.stage("tick"):
+            limit_frame_rate(clock, frame_governor.fps(settings))
+
+    net_client.close()
+    settings_store.close()
+    audio.close()
+    if input_queue.recording is not None:
+        input_queue.save_recording(sys.argv[sys.argv.index("--record") + 1])
+    if profiler.enabled:
+        profiler.dump(profile_path)
     pygame.quit()
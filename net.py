@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import math
+import struct
+import sys
+import threading
+import time
+import numpy as np
+
+# Wire format ------------------------------------
+# Every datagram starts with a message type byte. Integers and floats are little-endian.
+#   HELLO     <BH   type, protocol version
+#   WELCOME   <BI   type, client id
+#   SNAPSHOT  <BIIdHHII type, tick, baseline tick (0 = full snapshot), server time, part, parts,
+#                   changed count, removed count; then a slice of the payload (changed entity records,
+#                   then removed ids as u32). A snapshot bigger than a datagram is cut into parts that
+#                   each carry the full header, the client puts them back together before decoding.
+#   ACK       <BI   type, tick
+#   INPUT     <BIBf type, tick, buttons bitmask, aim angle
+#   BYE       <B    type
+protocol_version = 2
+MSG_HELLO, MSG_WELCOME, MSG_SNAPSHOT, MSG_ACK, MSG_INPUT, MSG_BYE = range(1, 7)
+hello_format = struct.Struct("<BH")
+welcome_format = struct.Struct("<BI")
+snapshot_format = struct.Struct("<BIIdHHII")
+ack_format = struct.Struct("<BI")
+input_format = struct.Struct("<BIBf")
+bye_format = struct.Struct("<B")
+# below the minimum IPv6 MTU with the UDP/IP headers added, so no datagram gets fragmented on the way
+max_datagram = 1200
+BUTTON_FORWARD, BUTTON_BACK, BUTTON_LEFT, BUTTON_RIGHT, BUTTON_FIRE = 1, 2, 4, 8, 16
+
+# One record per entity, 18 bytes. Angle is quantized to 1/65536 of a turn.
+entity_dtype = np.dtype([
+    ("id", "<u4"),
+    ("kind", "u1"),
+    ("flags", "u1"),
+    ("health", "<u2"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("angle", "<u2")
+])
+
+
+def quantize_angle(angles):
+    return (np.asarray(angles) % math.tau / math.tau * 65536).astype(np.uint32).astype("<u2")
+
+
+def dequantize_angle(angles):
+    return angles.astype(np.float32) / 65536 * math.tau
+
+
+def delta(entities, baseline):
+    # Records that are new or differ from the baseline, and ids the baseline had that are gone.
+    # Both arrays are sorted by id.
+    if baseline is None or len(baseline) == 0:
+        return entities, np.empty(0, "<u4")
+    index = np.minimum(np.searchsorted(baseline["id"], entities["id"]), len(baseline) - 1)
+    unchanged = (baseline["id"][index] == entities["id"]) & (baseline[index] == entities)
+    removed = baseline["id"][~np.isin(baseline["id"], entities["id"], assume_unique=True)]
+    return entities[~unchanged], removed.astype("<u4")
+
+
+def apply_delta(baseline, changed, removed):
+    if baseline is None or len(baseline) == 0:
+        return changed.copy()
+    keep = ~np.isin(baseline["id"], removed, assume_unique=True) & ~np.isin(baseline["id"], changed["id"],
+                                                                          assume_unique=True)
+    entities = np.concatenate([baseline[keep], changed])
+    return entities[np.argsort(entities["id"], kind="stable")]
+
+
+def pack_snapshot(tick, server_time, entities, baseline_tick=0, baseline=None):
+    # -> list of datagrams, each at most max_datagram bytes
+    changed, removed = delta(entities, baseline if baseline_tick else None)
+    payload = changed.tobytes() + removed.tobytes()
+    size = max_datagram - snapshot_format.size
+    parts = max(1, -(-len(payload) // size))
+    return [snapshot_format.pack(MSG_SNAPSHOT, tick, baseline_tick, server_time, part, parts, len(changed),
+                                 len(removed)) + payload[part * size:(part + 1) * size]
+            for part in range(parts)]
+
+
+def unpack_snapshot(parts, baselines):
+    # Every part of one snapshot, in order
+    # -> (tick, server_time, entities), or None when the baseline it was encoded against is gone
+    _, tick, baseline_tick, server_time, _, _, changed_count, removed_count = snapshot_format.unpack_from(parts[0])
+    data = b"".join(memoryview(part)[snapshot_format.size:] for part in parts)
+    changed = np.frombuffer(data, entity_dtype, changed_count)
+    removed = np.frombuffer(data, "<u4", removed_count, changed_count * entity_dtype.itemsize)
+    if baseline_tick == 0:
+        return tick, server_time, changed.copy()
+    if baseline_tick not in baselines:
+        return None
+    return tick, server_time, apply_delta(baselines[baseline_tick], changed, removed)
+
+
+# Client ------------------------------------
+class ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client.received(data)
+
+    def error_received(self, exc):
+        # while connecting a lost hello is just sent again, running out of attempts fails it
+        if self.client.status == "connected":
+            self.client.status = "failed"
+
+
+class NetClient:
+    # Runs its own asyncio loop on a daemon thread; the pygame main loop only calls the non-blocking
+    # methods (connect, latest, send_input, close) and reads status.
+    # status: idle -> connecting -> connected, or failed / closed
+    def __init__(self, history=64):
+        self.status = "idle"
+        self.client_id = None
+        self.history = history
+        self.baselines = {}
+        # tick -> parts received so far of a snapshot that came in several datagrams
+        self.partial = {}
+        self.snapshot = None
+        self.snapshot_lock = threading.Lock()
+        self.transport = None
+        self.welcomed = None
+        # future of the running handshake, there is never more than one
+        self.connecting = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="net-client", daemon=True)
+        self.thread.start()
+        self.stats = {"snapshots": 0, "bytes": 0, "dropped": 0}
+
+    def connect(self, host, port, timeout=1.0, attempts=3):
+        if self.status in ("connecting", "connected") or self.connecting is not None and not self.connecting.done():
+            return
+        self.status = "connecting"
+        self.connecting = asyncio.run_coroutine_threadsafe(self.run_connect(host, port, timeout, attempts), self.loop)
+
+    async def run_connect(self, host, port, timeout, attempts):
+        if self.transport is not None:
+            # left over from a connection that failed after the handshake
+            self.transport.close()
+            self.transport = None
+        try:
+            self.transport, _ = await self.loop.create_datagram_endpoint(lambda: ClientProtocol(self),
+                                                                         remote_addr=(host, port))
+        except OSError:
+            self.status = "failed"
+            return
+        self.welcomed = asyncio.Event()
+        for _ in range(attempts):
+            self.transport.sendto(hello_format.pack(MSG_HELLO, protocol_version))
+            try:
+                await asyncio.wait_for(self.welcomed.wait(), timeout)
+                self.status = "connected"
+                return
+            except asyncio.TimeoutError:
+                pass
+        self.transport.close()
+        self.transport = None
+        self.status = "failed"
+
+    def received(self, data):
+        kind = data[0]
+        if kind == MSG_WELCOME:
+            self.client_id = welcome_format.unpack_from(data)[1]
+            self.welcomed.set()
+        elif kind == MSG_SNAPSHOT:
+            _, tick, _, _, part, parts = snapshot_format.unpack_from(data)[:6]
+            received = self.partial.setdefault(tick, [None] * parts)
+            received[part] = data
+            if None in received:
+                return
+            # parts of older ticks still missing some won't be needed anymore, the server keeps
+            # encoding against the last tick we acked
+            for stale in [stale for stale in self.partial if stale <= tick]:
+                del self.partial[stale]
+            snapshot = unpack_snapshot(received, self.baselines)
+            if snapshot is None:
+                self.stats["dropped"] += 1
+                return
+            tick, server_time, entities = snapshot
+            self.baselines[tick] = entities
+            if len(self.baselines) > self.history:
+                del self.baselines[min(self.baselines)]
+            self.transport.sendto(ack_format.pack(MSG_ACK, tick))
+            self.stats["snapshots"] += 1
+            self.stats["bytes"] += sum(map(len, received))
+            with self.snapshot_lock:
+                if self.snapshot is None or tick > self.snapshot[0]:
+                    self.snapshot = (tick, server_time, time.perf_counter(), entities)
+        elif kind == MSG_BYE:
+            self.status = "closed"
+
+    def latest(self):
+        # (tick, server time, local receive time, entity array) of the newest snapshot, or None
+        with self.snapshot_lock:
+            return self.snapshot
+
+    def send_input(self, tick, buttons, aim):
+        if self.status == "connected":
+            self.loop.call_soon_threadsafe(self.transport.sendto, input_format.pack(MSG_INPUT, tick, buttons, aim))
+
+    def close(self):
+        def shutdown():
+            if self.transport is not None:
+                self.transport.sendto(bye_format.pack(MSG_BYE))
+                self.transport.close()
+            self.loop.stop()
+
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(shutdown)
+            self.thread.join(1.0)
+        self.status = "closed"
+
+
+# Reference server ------------------------------------
+class ServerProtocol(asyncio.DatagramProtocol):
+    # Handles the handshake and acks for a server loop; `server` provides
+    # client_joined(addr), client_left(addr), client_acked(addr, tick) and client_input(addr, ...).
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        kind = data[0]
+        if kind == MSG_HELLO:
+            if hello_format.unpack_from(data)[1] == protocol_version:
+                client_id = self.server.client_joined(addr)
+                # None: the server can't take the client right now
+                if client_id is not None:
+                    self.transport.sendto(welcome_format.pack(MSG_WELCOME, client_id), addr)
+        elif kind == MSG_ACK:
+            self.server.client_acked(addr, ack_format.unpack_from(data)[1])
+        elif kind == MSG_INPUT:
+            self.server.client_input(addr, *input_format.unpack_from(data)[1:])
+        elif kind == MSG_BYE:
+            self.server.client_left(addr)
+
+
+class LocalServer:
+    # Stand-in server until the real one exists: moves `count` synthetic entities in circles and
+    # sends every client a snapshot per tick, delta-encoded against the client's last acked tick.
+    # A client that sent nothing (no ack, input or hello) for `timeout` seconds is dropped.
+    def __init__(self, count=256, tick_rate=30, history=64, timeout=5.0):
+        self.tick_rate = tick_rate
+        self.history = history
+        self.timeout = timeout
+        self.tick = 0
+        self.clients = {}
+        self.next_client_id = 1
+        self.snapshots = {}
+        self.entities = np.zeros(count, entity_dtype)
+        self.entities["id"] = np.arange(1, count + 1)
+        self.entities["health"] = 100
+        self.phase = np.linspace(0, math.tau, count, endpoint=False)
+        self.protocol = None
+
+    def client_joined(self, addr):
+        if addr not in self.clients:
+            self.clients[addr] = {"id": self.next_client_id, "acked": 0}
+            self.next_client_id += 1
+        self.clients[addr]["seen"] = time.perf_counter()
+        return self.clients[addr]["id"]
+
+    def client_left(self, addr):
+        self.clients.pop(addr, None)
+
+    def client_acked(self, addr, tick):
+        client = self.clients.get(addr)
+        if client is not None:
+            client["seen"] = time.perf_counter()
+            client["acked"] = max(client["acked"], tick)
+
+    def client_input(self, addr, tick, buttons, aim):
+        if addr in self.clients:
+            self.clients[addr]["seen"] = time.perf_counter()
+
+    def drop_silent(self, now):
+        # clients that went away without a bye (crash, lost connection)
+        for addr in [addr for addr, client in self.clients.items() if now - client["seen"] > self.timeout]:
+            self.client_left(addr)
+
+    def simulate(self):
+        self.tick += 1
+        # only every other entity moves each tick, so deltas have something to skip
+        moving = (self.entities["id"] + self.tick) % 2 == 0
+        angle = self.phase + self.tick / self.tick_rate
+        self.entities["x"][moving] = (np.cos(angle) * 300 + 600)[moving]
+        self.entities["y"][moving] = (np.sin(angle) * 200 + 300)[moving]
+        self.entities["angle"][moving] = quantize_angle(angle + math.pi / 2)[moving]
+        self.snapshots[self.tick] = self.entities.copy()
+        self.snapshots.pop(self.tick - self.history, None)
+
+    def broadcast(self):
+        now = time.perf_counter()
+        self.drop_silent(now)
+        for addr, client in self.clients.items():
+            baseline_tick = client["acked"] if client["acked"] in self.snapshots else 0
+            for data in pack_snapshot(self.tick, now, self.entities, baseline_tick, self.snapshots.get(baseline_tick)):
+                self.protocol.transport.sendto(data, addr)
+
+    async def serve(self, host="127.0.0.1", port=7777, stop=None):
+        loop = asyncio.get_running_loop()
+        transport, self.protocol = await loop.create_datagram_endpoint(lambda: ServerProtocol(self),
+                                                                       local_addr=(host, port))
+        next_tick = loop.time()
+        try:
+            while stop is None or not stop.is_set():
+                self.simulate()
+                self.broadcast()
+                next_tick += 1 / self.tick_rate
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        finally:
+            transport.close()
+
+
+def loopback_benchmark(count, seconds, tick_rate, port):
+    # Server on its own thread + loop, client as the game would use it; reports throughput,
+    # bandwidth with and without delta compression, and send-to-receive latency.
+    stop = threading.Event()
+    server = LocalServer(count, tick_rate)
+    server_thread = threading.Thread(target=lambda: asyncio.run(server.serve("127.0.0.1", port, stop)), daemon=True)
+    server_thread.start()
+    time.sleep(0.2)
+
+    client = NetClient()
+    client.connect("127.0.0.1", port)
+    latencies = []
+    last_tick = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        snapshot = client.latest()
+        if snapshot is not None and snapshot[0] != last_tick:
+            last_tick = snapshot[0]
+            latencies.append((snapshot[2] - snapshot[1]) * 1000)
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    client.close()
+    stop.set()
+    server_thread.join(2.0)
+
+    latencies.sort()
+    full_size = snapshot_format.size + count * entity_dtype.itemsize
+    received = max(client.stats["snapshots"], 1)
+    print("status          %s" % client.status)
+    print("snapshots/s     %.1f (dropped %d)" % (client.stats["snapshots"] / elapsed, client.stats["dropped"]))
+    print("bytes/snapshot  %.0f (full snapshot %d)" % (client.stats["bytes"] / received, full_size))
+    print("KB/s            %.1f" % (client.stats["bytes"] / elapsed / 1024))
+    if latencies:
+        print("latency ms      p50 %.3f  p95 %.3f  max %.3f" % (latencies[len(latencies) // 2],
+                                                              latencies[int(len(latencies) * 0.95)], latencies[-1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reference server stand-in and loopback benchmark")
+    parser.add_argument("mode", choices=("serve", "bench"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--entities", type=int, default=256)
+    parser.add_argument("--tick-rate", type=int, default=30)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args(sys.argv[1:])
+    if args.mode == "serve":
+        asyncio.run(LocalServer(args.entities, args.tick_rate).serve(args.host, args.port))
+    else:
+        loopback_benchmark(args.entities, args.seconds, args.tick_rate, args.port)
@@ -0,0 +1,58 @@
+import json
+import struct
+import numpy as np
+
+# Input log: header, the settings the session started with as UTF-8 JSON, then one record per
+# input event, in tick order.
+#   <4sHHII  magic, version, tick rate, number of ticks, settings length
+# Events are stored as a structured array, so a log loads with one np.frombuffer.
+log_header = struct.Struct("<4sHHII")
+log_magic = b"BSPR"
+log_version = 1
+event_dtype = np.dtype([("tick", "<u4"), ("type", "<u2"), ("key", "<u4")])
+
+
+class InputLog:
+    # Events stamped with the simulation tick they were handled on. Replaying hands them out on the
+    # same ticks, so a session runs the same way as long as the simulation itself is deterministic.
+    def __init__(self, tick_rate, settings, events=None, ticks=0):
+        self.tick_rate = tick_rate
+        self.settings = settings
+        self.events = [] if events is None else events
+        self.ticks = ticks
+        self.cursor = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, tick_rate, ticks, settings_length = log_header.unpack_from(data)
+        if magic != log_magic or version != log_version:
+            raise ValueError("%s is not a version %d input log" % (path, log_version))
+        start = log_header.size + settings_length
+        settings = json.loads(data[log_header.size:start].decode('utf-8'))
+        events = np.frombuffer(data, event_dtype, offset=start)
+        return cls(tick_rate, settings, [tuple(map(int, event)) for event in events], ticks)
+
+    def save(self, path):
+        settings = json.dumps(self.settings).encode('utf-8')
+        with open(path, 'wb') as file:
+            file.write(log_header.pack(log_magic, log_version, self.tick_rate, self.ticks, len(settings)))
+            file.write(settings)
+            file.write(np.array(self.events, dtype=event_dtype).tobytes())
+
+    def add(self, tick, event_type, key):
+        self.events.append((tick, event_type, key))
+        self.ticks = max(self.ticks, tick + 1)
+
+    def take(self, tick):
+        # (type, key) of every event recorded on `tick`, call once per tick in order
+        taken = []
+        while self.cursor < len(self.events) and self.events[self.cursor][0] <= tick:
+            taken.append(self.events[self.cursor][1:])
+            self.cursor += 1
+        return taken
+
+    @property
+    def finished(self):
+        return self.cursor >= len(self.events)
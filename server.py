@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from gamedata import ship_stats, modifiers
+from net import ServerProtocol, pack_snapshot, BUTTON_FORWARD, BUTTON_BACK, BUTTON_LEFT, BUTTON_RIGHT, BUTTON_FIRE
+from collision import CollisionSystem
+from spatial import SpatialGrid
+from stats import StatEngine
+from world import World
+
+# Headless authoritative server, no pygame/moderngl so it runs on machines without a display.
+#   python server.py --matches 4 --port 7777     (matches listen on 7777, 7778, ...)
+# Every match has its own UDP port. Matches are spread over a pool of worker processes (one per CPU
+# by default), each worker runs its share of matches on one event loop.
+
+config = {
+    "tick_rate": 30,
+    "world": (8192.0, 8192.0),
+    "cell_size": 256.0,
+    # Half extents of the area around a player's ship that its snapshots cover
+    "view": (1000.0, 700.0),
+    "history": 64,
+    "capacity": 16384,
+    # seconds without an ack, input or hello before a player is dropped and their ship despawned
+    "timeout": 5.0
+}
+
+
+class Match:
+    def __init__(self, match_id, tick_rate=config["tick_rate"], bots=0, seed=0):
+        self.match_id = match_id
+        self.tick_rate = tick_rate
+        self.tick_time = 1 / tick_rate
+        self.tick = 0
+        self.world = World(config["capacity"], *config["world"])
+        self.grid = SpatialGrid(*config["world"], config["cell_size"])
+        self.collisions = CollisionSystem(*config["world"])
+        self.stat_engine = StatEngine(modifiers, ship_stats)
+        self.players = {}
+        self.next_player_id = 1
+        self.protocol = None
+        # last minute of tick times, seconds
+        self.tick_durations = deque(maxlen=tick_rate * 60)
+        self.base_stats = self.stat_engine.as_dict(self.stat_engine.resolve([]))
+        self.random = random = np.random.default_rng(seed)
+        self.bots = []
+        for _ in range(bots):
+            i = self.world.spawn_ship(*(random.random(2) * config["world"]), random.random() * math.tau,
+                                      self.base_stats)
+            if i < 0:
+                break
+            # circle around, shooting whenever the weapon is ready
+            self.world.thrust[i] = 1.0
+            self.world.turn[i] = random.uniform(-0.3, 0.3)
+            self.bots.append(i)
+
+    # ServerProtocol callbacks
+    def client_joined(self, addr):
+        if addr not in self.players:
+            width, height = config["world"]
+            ship = self.world.spawn_ship(width / 2, height / 2, 0.0, self.base_stats)
+            if ship < 0:
+                # no room right now, the client's next hello tries again
+                return None
+            self.players[addr] = {
+                "id": self.next_player_id,
+                "ship": ship,
+                "buttons": 0,
+                "acked": 0,
+                "snapshots": {}
+            }
+            self.next_player_id += 1
+        self.players[addr]["seen"] = time.perf_counter()
+        return self.players[addr]["id"]
+
+    def client_left(self, addr):
+        player = self.players.pop(addr, None)
+        if player is not None:
+            self.world.despawn(player["ship"])
+
+    def client_acked(self, addr, tick):
+        player = self.players.get(addr)
+        if player is not None:
+            player["seen"] = time.perf_counter()
+            player["acked"] = max(player["acked"], tick)
+
+    def client_input(self, addr, tick, buttons, aim):
+        player = self.players.get(addr)
+        if player is not None:
+            player["seen"] = time.perf_counter()
+            player["buttons"] = buttons
+
+    def drop_silent(self):
+        # players that went away without a bye (crash, lost connection) would keep their ship forever
+        now = time.perf_counter()
+        for addr in [addr for addr, player in self.players.items() if now - player["seen"] > config["timeout"]]:
+            self.client_left(addr)
+
+    def apply_inputs(self):
+        for player in self.players.values():
+            ship, buttons = player["ship"], player["buttons"]
+            self.world.turn[ship] = bool(buttons & BUTTON_RIGHT) - bool(buttons & BUTTON_LEFT)
+            self.world.thrust[ship] = bool(buttons & BUTTON_FORWARD) - bool(buttons & BUTTON_BACK)
+            if buttons & BUTTON_FIRE:
+                self.world.fire(ship)
+        for ship in self.bots:
+            self.world.fire(ship)
+
+    def simulate(self):
+        self.tick += 1
+        self.drop_silent()
+        self.apply_inputs()
+        self.world.step(self.tick_time)
+        active = self.collisions.update(self.world)
+        for ship in self.world.hit(self.collisions.projectiles(self.world, active)):
+            self.world.respawn(ship, *(self.random.random(2) * config["world"]))
+        self.grid.build(self.world.position, self.world.active())
+
+    def visible(self, player):
+        x, y = self.world.position[player["ship"]]
+        view_x, view_y = config["view"]
+        return self.grid.query(x - view_x, y - view_y, x + view_x, y + view_y)
+
+    def broadcast(self):
+        now = time.perf_counter()
+        for addr, player in self.players.items():
+            # Baselines are per player, everyone sees a different part of the world
+            entities = self.world.records(self.visible(player))
+            player["snapshots"][self.tick] = entities
+            player["snapshots"].pop(self.tick - config["history"], None)
+            baseline_tick = player["acked"] if player["acked"] in player["snapshots"] else 0
+            for data in pack_snapshot(self.tick, now, entities, baseline_tick, player["snapshots"].get(baseline_tick)):
+                self.protocol.transport.sendto(data, addr)
+
+    async def serve(self, host, port, stop=None):
+        loop = asyncio.get_running_loop()
+        transport, self.protocol = await loop.create_datagram_endpoint(lambda: ServerProtocol(self),
+                                                                       local_addr=(host, port))
+        next_tick = loop.time()
+        try:
+            while stop is None or not stop.is_set():
+                start = time.perf_counter()
+                self.simulate()
+                self.broadcast()
+                self.tick_durations.append(time.perf_counter() - start)
+                next_tick += self.tick_time
+                if loop.time() - next_tick > self.tick_time * 5:
+                    # Too far behind, skip the backlog instead of running ticks back to back
+                    next_tick = loop.time()
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        finally:
+            transport.close()
+
+
+async def serve_matches(match_ids, host, port, tick_rate, bots):
+    matches = [Match(match_id, tick_rate, bots, seed=match_id) for match_id in match_ids]
+    for match in matches:
+        print("match %d listening on %s:%d" % (match.match_id, host, port + match.match_id), flush=True)
+    await asyncio.gather(*(match.serve(host, port + match.match_id) for match in matches))
+
+
+def run_matches(match_ids, host, port, tick_rate, bots):
+    try:
+        asyncio.run(serve_matches(match_ids, host, port, tick_rate, bots))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless authoritative game server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=7777, help="port of the first match, the rest count up")
+    parser.add_argument("--matches", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to one per CPU")
+    parser.add_argument("--tick-rate", type=int, default=config["tick_rate"])
+    parser.add_argument("--bots", type=int, default=0, help="drifting ships per match, for load testing")
+    args = parser.parse_args(sys.argv[1:])
+    workers = min(args.workers or os.cpu_count() or 1, args.matches)
+    if workers == 1:
+        run_matches(range(args.matches), args.host, args.port, args.tick_rate, args.bots)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(run_matches, range(i, args.matches, workers), args.host, args.port,
+                                       args.tick_rate, args.bots) for i in range(workers)]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                executor.shutdown(cancel_futures=True)
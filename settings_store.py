@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def validate(value, rule, default):
+    # rule: {"type": int/float/bool/str, "min": .., "max": ..} or {"options": [...]}
+    if "options" in rule:
+        return value if value in rule["options"] else default
+    kind = rule["type"]
+    if isinstance(value, bool) and kind is not bool:
+        return default
+    if kind is float and isinstance(value, int):
+        value = float(value)
+    if not isinstance(value, kind):
+        return default
+    if "min" in rule and value < rule["min"] or "max" in rule and value > rule["max"]:
+        return default
+    return value
+
+
+class SettingsStore:
+    # The settings file merged over the defaults, every value checked against the schema (anything
+    # missing or invalid falls back to its default). `data` is the live dict the game reads and
+    # edits. save() only marks it for writing: a writer thread waits until no save() came in for
+    # `delay` seconds, then writes a snapshot to a temp file and renames it over the real one, so
+    # the file is never half written and a burst of edits costs one write off the main thread.
+    def __init__(self, path, defaults, schema, delay=0.5):
+        self.path = path
+        self.defaults = defaults
+        self.schema = schema
+        self.delay = delay
+        # False keeps changes in memory only (replays)
+        self.persist = True
+        self.pending = None
+        self.deadline = 0.0
+        self.closed = False
+        # mode for a new settings file, the temp file is always created 0600. Reading the umask
+        # means setting it, done once here rather than on the writer thread
+        umask = os.umask(0)
+        os.umask(umask)
+        self.new_file_mode = 0o666 & ~umask
+        self.condition = threading.Condition()
+        self.data = self.load()
+        self.thread = threading.Thread(target=self.run_writer, name="settings-writer", daemon=True)
+        self.thread.start()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            stored = None
+        if not isinstance(stored, dict):
+            stored = {}
+        data = {name: validate(stored.get(name, default), self.schema[name], default)
+                for name, default in self.defaults.items()}
+        if data != stored:
+            # missing or fixed values are written back by the writer thread, right away
+            self.pending = dict(data)
+        return data
+
+    def write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=directory, prefix=".settings.", suffix=".tmp",
+                                             delete=False, encoding='utf-8') as file:
+                json.dump(data, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            try:
+                mode = os.stat(self.path).st_mode & 0o777
+            except OSError:
+                mode = self.new_file_mode
+            os.chmod(file.name, mode)
+            os.replace(file.name, self.path)
+        except OSError:
+            # read-only install, settings just aren't kept
+            pass
+
+    def save(self):
+        if not self.persist:
+            return
+        with self.condition:
+            self.pending = dict(self.data)
+            self.deadline = time.monotonic() + self.delay
+            self.condition.notify()
+
+    def run_writer(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0 and not self.closed:
+                    self.condition.wait(remaining)
+                    continue
+                data, self.pending = self.pending, None
+            self.write(data)
+
+    def close(self):
+        # Writes whatever is still pending right away, call on exit
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,18 @@
+#version 330 core
+
+uniform sampler2D tex;
+uniform vec2 direction;
+uniform int radius;
+uniform float weights[MAX_BLOOM_RADIUS + 1];
+
+in vec2 uvs;
+out vec4 f_color;
+
+void main() {
+    vec3 color = texture(tex, uvs).rgb * weights[0];
+    for (int i = 1; i <= radius; i++) {
+        color += texture(tex, uvs + direction * i).rgb * weights[i];
+        color += texture(tex, uvs - direction * i).rgb * weights[i];
+    }
+    f_color = vec4(color, 1.0);
+}
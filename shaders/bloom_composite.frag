@@ -0,0 +1,12 @@
+#version 330 core
+
+uniform sampler2D tex;
+uniform sampler2D scene;
+uniform float bloomIntensity;
+
+in vec2 uvs;
+out vec4 f_color;
+
+void main() {
+    f_color = vec4(texture(scene, uvs).rgb + texture(tex, uvs).rgb * bloomIntensity, 1.0);
+}
@@ -0,0 +1,18 @@
+#version 330 core
+
+uniform sampler2D tex;
+uniform float threshold;
+uniform vec2 texel;
+
+in vec2 uvs;
+out vec4 f_color;
+
+void main() {
+    // 2x2 box filter while downsampling so thin bright lines don't flicker
+    vec3 color = (texture(tex, uvs + texel * vec2(-0.5, -0.5)).rgb +
+                  texture(tex, uvs + texel * vec2(0.5, -0.5)).rgb +
+                  texture(tex, uvs + texel * vec2(-0.5, 0.5)).rgb +
+                  texture(tex, uvs + texel * vec2(0.5, 0.5)).rgb) * 0.25;
+    float luminance = (color.r + color.g + color.b) / 3.0;
+    f_color = vec4(luminance > threshold ? color : vec3(0.0), 1.0);
+}
@@ -0,0 +1,12 @@
+#version 330 core
+
+in vec2 offset;
+in vec4 tint;
+out vec4 f_color;
+
+void main() {
+    float falloff = max(1.0 - dot(offset, offset), 0.0);
+    // alpha 0: added on top of whatever is under it in the premultiplied layer, bright enough
+    // particles go past the bloom threshold
+    f_color = vec4(tint.rgb * tint.a * falloff * falloff, 0.0);
+}
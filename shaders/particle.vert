@@ -0,0 +1,23 @@
+#version 330 core
+
+uniform vec2 screen_size;
+uniform vec2 camera;
+
+in vec2 vert;
+in vec2 position;  // world pixels
+in vec3 life;
+in float size;
+in vec4 color;
+
+out vec2 offset;
+out vec4 tint;
+
+void main() {
+    float t = life.x / max(life.y, 1e-6);
+    // expired (and never used) particles collapse to a point and produce no fragments
+    float alive = float(life.x < life.y);
+    offset = vert;
+    tint = color * (1.0 - t);
+    vec2 corner = vert * 0.5 * size * (1.0 - 0.5 * t) * alive;
+    gl_Position = vec4((position + corner - camera) / screen_size * 2.0 - 1.0, 0.0, 1.0);
+}
@@ -0,0 +1,23 @@
+#version 330 core
+
+uniform float dt;
+
+in vec2 in_position;
+in vec2 in_velocity;
+in vec3 in_life;  // age, lifetime, drag (fraction of the velocity kept per second)
+in float in_size;
+in vec4 in_color;
+
+out vec2 out_position;
+out vec2 out_velocity;
+out vec3 out_life;
+out float out_size;
+out vec4 out_color;
+
+void main() {
+    out_velocity = in_velocity * pow(in_life.z, dt);
+    out_position = in_position + out_velocity * dt;
+    out_life = vec3(in_life.x + dt, in_life.yz);
+    out_size = in_size;
+    out_color = in_color;
+}
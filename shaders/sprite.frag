@@ -0,0 +1,12 @@
+#version 330 core
+
+uniform sampler2D tex;
+
+in vec2 uvs;
+in vec4 color;
+out vec4 f_color;
+
+void main() {
+    vec4 texel = texture(tex, uvs) * color;
+    f_color = vec4(texel.rgb * texel.a, texel.a);
+}
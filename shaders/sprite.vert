@@ -0,0 +1,25 @@
+#version 330 core
+
+uniform vec2 screen_size;
+
+in vec2 vert;
+in vec2 texcoord;
+in vec4 rect;       // center x, y and size w, h in pixels
+in float rotation;  // radians, clockwise on screen
+in vec4 uv_rect;    // u0, v0, u1, v1 in the atlas page
+in vec4 tint;
+
+out vec2 uvs;
+out vec4 color;
+
+void main() {
+    vec2 local = vec2(vert.x, -vert.y) * 0.5 * rect.zw;
+    float c = cos(rotation);
+    float s = sin(rotation);
+    vec2 position = rect.xy + vec2(local.x * c - local.y * s, local.x * s + local.y * c);
+    uvs = mix(uv_rect.xy, uv_rect.zw, texcoord);
+    color = tint;
+    // pixel y goes down and so do clip y here: the layer ends up stored top row first, the same way
+    // the frame texture is uploaded from the display surface, so both share uvs in PostProcess
+    gl_Position = vec4(position / screen_size * 2.0 - 1.0, 0.0, 1.0);
+}
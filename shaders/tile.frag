@@ -0,0 +1,11 @@
+#version 330 core
+
+uniform sampler2D tex;
+
+in vec2 uvs;
+out vec4 f_color;
+
+void main() {
+    vec4 texel = texture(tex, uvs);
+    f_color = vec4(texel.rgb * texel.a, texel.a);
+}
@@ -0,0 +1,15 @@
+#version 330 core
+
+uniform vec2 screen_size;
+uniform vec2 camera;
+
+in vec2 position;  // world pixels
+in vec2 texcoord;
+
+out vec2 uvs;
+
+void main() {
+    uvs = texcoord;
+    // same y-down mapping as the sprites, the tiles land in the sprite layer
+    gl_Position = vec4((position - camera) / screen_size * 2.0 - 1.0, 0.0, 1.0);
+}
@@ -0,0 +1,64 @@
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def build_cells(positions, indices, cell_size, columns, rows):
+    # Counting sort of entities into grid cells: entities of cell c are
+    # cell_entities[cell_start[c]:cell_start[c + 1]]. Positions outside the grid clamp to the edge cells.
+    cells = np.empty(indices.shape[0], dtype=np.int64)
+    cell_start = np.zeros(columns * rows + 1, dtype=np.int64)
+    for k in range(indices.shape[0]):
+        i = indices[k]
+        column = min(max(int(positions[i, 0] / cell_size), 0), columns - 1)
+        row = min(max(int(positions[i, 1] / cell_size), 0), rows - 1)
+        cells[k] = row * columns + column
+        cell_start[cells[k] + 1] += 1
+    for c in range(columns * rows):
+        cell_start[c + 1] += cell_start[c]
+    fill = cell_start[:-1].copy()
+    cell_entities = np.empty(indices.shape[0], dtype=np.int64)
+    for k in range(indices.shape[0]):
+        cell_entities[fill[cells[k]]] = indices[k]
+        fill[cells[k]] += 1
+    return cell_start, cell_entities
+
+
+@numba.njit(cache=True)
+def query_cells(positions, cell_start, cell_entities, cell_size, columns, rows, x0, y0, x1, y1):
+    # Entities inside the rectangle, only looking at the cells it overlaps
+    first_column = min(max(int(x0 / cell_size), 0), columns - 1)
+    last_column = min(max(int(x1 / cell_size), 0), columns - 1)
+    first_row = min(max(int(y0 / cell_size), 0), rows - 1)
+    last_row = min(max(int(y1 / cell_size), 0), rows - 1)
+    found = np.empty(cell_entities.shape[0], dtype=np.int64)
+    count = 0
+    for row in range(first_row, last_row + 1):
+        for column in range(first_column, last_column + 1):
+            c = row * columns + column
+            for k in range(cell_start[c], cell_start[c + 1]):
+                i = cell_entities[k]
+                if x0 <= positions[i, 0] <= x1 and y0 <= positions[i, 1] <= y1:
+                    found[count] = i
+                    count += 1
+    return found[:count]
+
+
+class SpatialGrid:
+    # Uniform grid over the world, rebuilt from scratch every tick (a counting sort, O(n)).
+    def __init__(self, width, height, cell_size=256.0):
+        self.cell_size = float(cell_size)
+        self.columns = max(1, int(np.ceil(width / cell_size)))
+        self.rows = max(1, int(np.ceil(height / cell_size)))
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+        self.cell_start = np.zeros(self.columns * self.rows + 1, dtype=np.int64)
+        self.cell_entities = np.zeros(0, dtype=np.int64)
+
+    def build(self, positions, indices):
+        self.positions = positions
+        self.cell_start, self.cell_entities = build_cells(positions, indices.astype(np.int64), self.cell_size,
+                                                          self.columns, self.rows)
+
+    def query(self, x0, y0, x1, y1):
+        return query_cells(self.positions, self.cell_start, self.cell_entities, self.cell_size, self.columns,
+                           self.rows, float(x0), float(y0), float(x1), float(y1))
@@ -0,0 +1,86 @@
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def resolve_stats(loadouts, base, multipliers, overrides, override_mask):
+    # loadouts: (ships, modifiers) bool, the rest come from StatEngine. "mul" effects stack
+    # multiplicatively, then "set" effects replace the value (the last modifier in order wins).
+    ships = loadouts.shape[0]
+    out = np.empty((ships, base.shape[0]))
+    for ship in range(ships):
+        for stat in range(base.shape[0]):
+            value = base[stat]
+            override = 0.0
+            overridden = False
+            for modifier in range(loadouts.shape[1]):
+                if loadouts[ship, modifier]:
+                    value *= multipliers[modifier, stat]
+                    if override_mask[modifier, stat]:
+                        override = overrides[modifier, stat]
+                        overridden = True
+            out[ship, stat] = override if overridden else value
+    return out
+
+
+class StatEngine:
+    # Compiles the modifiers table into dense arrays: every stat gets a column, "mul" effects go into
+    # a multiplier matrix and "set" effects into an override matrix plus mask. Loadouts (iterables of
+    # modifier keys) resolve to stat vectors in bulk, and results are cached per loadout.
+    def __init__(self, modifiers, base_stats):
+        self.modifiers = list(modifiers.keys())
+        self.modifier_index = {key: i for i, key in enumerate(self.modifiers)}
+        self.stats = list(base_stats.keys())
+        for modifier in modifiers.values():
+            for stat in modifier["effects"]:
+                if stat not in self.stats:
+                    self.stats.append(stat)
+        self.stat_index = {name: i for i, name in enumerate(self.stats)}
+
+        self.base = np.array([base_stats.get(name, 1.0) for name in self.stats], dtype=np.float64)
+        self.multipliers = np.ones((len(self.modifiers), len(self.stats)), dtype=np.float64)
+        self.overrides = np.zeros((len(self.modifiers), len(self.stats)), dtype=np.float64)
+        self.override_mask = np.zeros((len(self.modifiers), len(self.stats)), dtype=np.bool_)
+        for i, key in enumerate(self.modifiers):
+            for stat, value in modifiers[key]["effects"].items():
+                if modifiers[key]["action"] == "mul":
+                    self.multipliers[i, self.stat_index[stat]] = value
+                elif modifiers[key]["action"] == "set":
+                    self.overrides[i, self.stat_index[stat]] = value
+                    self.override_mask[i, self.stat_index[stat]] = True
+        self.cache = {}
+
+    def loadout_key(self, loadout):
+        return frozenset(loadout)
+
+    def loadout_mask(self, loadout):
+        mask = np.zeros(len(self.modifiers), dtype=np.bool_)
+        for key in loadout:
+            mask[self.modifier_index[key]] = True
+        return mask
+
+    def resolve_many(self, loadouts):
+        # (len(loadouts), len(self.stats)) array, only loadouts not seen before reach the kernel
+        keys = [self.loadout_key(loadout) for loadout in loadouts]
+        missing = list({key for key in keys if key not in self.cache})
+        if missing:
+            masks = np.array([self.loadout_mask(key) for key in missing], dtype=np.bool_)
+            resolved = resolve_stats(masks, self.base, self.multipliers, self.overrides, self.override_mask)
+            for key, row in zip(missing, resolved):
+                row.flags.writeable = False
+                self.cache[key] = row
+        if not keys:
+            return np.empty((0, len(self.stats)))
+        return np.array([self.cache[key] for key in keys])
+
+    def resolve(self, loadout):
+        key = self.loadout_key(loadout)
+        if key not in self.cache:
+            self.resolve_many([loadout])
+        return self.cache[key]
+
+    def stat(self, loadout, name):
+        return self.resolve(loadout)[self.stat_index[name]]
+
+    def as_dict(self, vector):
+        return {name: float(vector[i]) for i, name in enumerate(self.stats)}
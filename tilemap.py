@@ -0,0 +1,81 @@
+import struct
+import numpy as np
+
+# Map file: header, then the tiles as (chunk rows, chunk columns, chunk_size, chunk_size), so every
+# chunk is one contiguous block and the file can be memory-mapped as is.
+#   <4sHHIIH  magic, version, tile type (1 = uint8, 2 = uint16), chunk columns, chunk rows, chunk size
+map_header = struct.Struct("<4sHHIIH")
+map_magic = b"BSPM"
+map_version = 1
+tile_types = {1: np.uint8, 2: np.uint16}
+
+
+class TileMap:
+    # Tile ids (0 = empty) in fixed-size chunks. Every change bumps the chunk's revision, renderers
+    # rebuild a chunk's vertex buffer only when the revision they built from is out of date.
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.chunk_rows, self.chunk_columns, self.chunk_size = chunks.shape[:3]
+        self.width = self.chunk_columns * self.chunk_size
+        self.height = self.chunk_rows * self.chunk_size
+        self.revisions = np.ones((self.chunk_rows, self.chunk_columns), dtype=np.int64)
+
+    @classmethod
+    def new(cls, width, height, chunk_size=32, dtype=np.uint8):
+        # width and height in tiles, rounded up to whole chunks
+        rows = -(-height // chunk_size)
+        columns = -(-width // chunk_size)
+        return cls(np.zeros((rows, columns, chunk_size, chunk_size), dtype=dtype))
+
+    @classmethod
+    def from_array(cls, tiles, chunk_size=32):
+        tile_map = cls.new(tiles.shape[1], tiles.shape[0], chunk_size, tiles.dtype)
+        tile_map.fill_array(0, 0, tiles)
+        return tile_map
+
+    @classmethod
+    def load(cls, path, writable=False):
+        # Memory-mapped, only the chunks that are actually touched get read from disk
+        with open(path, 'rb') as file:
+            magic, version, tile_type, columns, rows, chunk_size = map_header.unpack(file.read(map_header.size))
+        if magic != map_magic or version != map_version or tile_type not in tile_types:
+            raise ValueError("%s is not a version %d map file" % (path, map_version))
+        return cls(np.memmap(path, tile_types[tile_type], 'r+' if writable else 'r', map_header.size,
+                             (rows, columns, chunk_size, chunk_size)))
+
+    def save(self, path):
+        tile_type = {np.dtype(dtype): code for code, dtype in tile_types.items()}[self.chunks.dtype]
+        with open(path, 'wb') as file:
+            file.write(map_header.pack(map_magic, map_version, tile_type, self.chunk_columns, self.chunk_rows,
+                                       self.chunk_size))
+            file.write(np.ascontiguousarray(self.chunks).tobytes())
+
+    def chunk(self, row, column):
+        return self.chunks[row, column]
+
+    def get(self, x, y):
+        return int(self.chunks[y // self.chunk_size, x // self.chunk_size, y % self.chunk_size, x % self.chunk_size])
+
+    def set(self, x, y, tile):
+        row, column = y // self.chunk_size, x // self.chunk_size
+        self.chunks[row, column, y % self.chunk_size, x % self.chunk_size] = tile
+        self.revisions[row, column] += 1
+
+    def fill_array(self, x, y, tiles):
+        # Writes a (height, width) array of tiles with its top left corner at tile x, y
+        size = self.chunk_size
+        for row in range(y // size, (y + tiles.shape[0] - 1) // size + 1):
+            for column in range(x // size, (x + tiles.shape[1] - 1) // size + 1):
+                x0, y0 = max(x, column * size), max(y, row * size)
+                x1, y1 = min(x + tiles.shape[1], (column + 1) * size), min(y + tiles.shape[0], (row + 1) * size)
+                self.chunks[row, column, y0 - row * size:y1 - row * size, x0 - column * size:x1 - column * size] = \
+                    tiles[y0 - y:y1 - y, x0 - x:x1 - x]
+                self.revisions[row, column] += 1
+
+    def visible_chunks(self, x0, y0, x1, y1, tile_size):
+        # (row, column) of every chunk overlapping the world pixel rectangle
+        span = self.chunk_size * tile_size
+        first_column, last_column = max(int(x0 // span), 0), min(int(x1 // span), self.chunk_columns - 1)
+        first_row, last_row = max(int(y0 // span), 0), min(int(y1 // span), self.chunk_rows - 1)
+        return [(row, column) for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
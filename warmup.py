@@ -0,0 +1,42 @@
+import time
+from gamedata import modifiers, ship_stats
+
+# Runs every numba kernel once through the code that uses it, so the compiled signatures match the
+# real calls and land in numba's on-disk cache (cache=True). Run it after installing or after
+# changing a kernel, so the first launch doesn't pay for compilation:
+#   python warmup.py
+# The client also runs warm_client() on its loading thread.
+
+
+def warm_client():
+    from loadout import LoadoutRules
+    from stats import StatEngine
+    engine = StatEngine(modifiers, ship_stats)
+    engine.resolve([])
+    LoadoutRules(modifiers).suggest(engine, {"damage": 1.0}, 1, 1, 0, 1)
+
+
+def warm_server():
+    from collision import CollisionSystem
+    from spatial import SpatialGrid
+    from world import World, KIND_SHIP
+    from stats import StatEngine
+    engine = StatEngine(modifiers, ship_stats)
+    world = World(16, 1024.0, 1024.0)
+    ship = world.spawn_ship(100.0, 100.0, 0.0, engine.as_dict(engine.resolve([])))
+    world.spawn(KIND_SHIP, 120.0, 100.0)
+    world.fire(ship)
+    world.step(1 / 30)
+    collisions = CollisionSystem(world.width, world.height)
+    world.hit(collisions.projectiles(world, collisions.update(world)))
+    collisions.lasers(world, [(0.0, 0.0)], [0.0], [100.0], [4.0], [ship])
+    grid = SpatialGrid(world.width, world.height)
+    grid.build(world.position, world.active())
+    grid.query(0, 0, 512, 512)
+
+
+if __name__ == "__main__":
+    for name, warm in (("client", warm_client), ("server", warm_server)):
+        start = time.perf_counter()
+        warm()
+        print("%s kernels ready in %.2f s" % (name, time.perf_counter() - start))
@@ -0,0 +1,232 @@
+import math
+import numba
+import numpy as np
+from net import entity_dtype, quantize_angle
+
+KIND_SHIP, KIND_PROJECTILE = 1, 2
+# Heat is 0..1, every shot adds heat_per_shot * the heating stat, reaching 1 overheats the weapon
+# for overheat_duration seconds
+heat_per_shot = 0.08
+cooling_rate = 0.35
+projectile_lifetime = 2.0
+radii = {KIND_SHIP: 16.0, KIND_PROJECTILE: 2.0}
+
+
+@numba.njit(cache=True)
+def steer(alive, kind, thrust, turn, angle, velocity, move_speed, rotation_speed, count, dt):
+    for i in range(count):
+        if alive[i] and kind[i] == KIND_SHIP:
+            angle[i] = (angle[i] + turn[i] * rotation_speed[i] * dt) % (2 * math.pi)
+            velocity[i, 0] = math.cos(angle[i]) * thrust[i] * move_speed[i]
+            velocity[i, 1] = math.sin(angle[i]) * thrust[i] * move_speed[i]
+
+
+@numba.njit(cache=True)
+def integrate(alive, position, velocity, count, dt, width, height):
+    for i in range(count):
+        if alive[i]:
+            position[i, 0] = min(max(position[i, 0] + velocity[i, 0] * dt, 0.0), width)
+            position[i, 1] = min(max(position[i, 1] + velocity[i, 1] * dt, 0.0), height)
+
+
+@numba.njit(cache=True)
+def update_heat(alive, heat, overheat, cooldown, count, dt):
+    for i in range(count):
+        if alive[i]:
+            cooldown[i] = max(cooldown[i] - dt, 0.0)
+            if overheat[i] > 0:
+                overheat[i] -= dt
+                if overheat[i] <= 0:
+                    overheat[i] = 0.0
+                    heat[i] = 0.0
+            else:
+                heat[i] = max(heat[i] - cooling_rate * dt, 0.0)
+
+
+@numba.njit(cache=True)
+def regenerate(alive, shield, max_shield, shield_regeneration, health, max_health, health_regeneration, count, dt):
+    for i in range(count):
+        if alive[i]:
+            shield[i] = min(shield[i] + shield_regeneration[i] * dt, max_shield[i])
+            health[i] = min(health[i] + health_regeneration[i] * dt, max_health[i])
+
+
+@numba.njit(cache=True)
+def apply_damage(hits, damage, shield, health, alive):
+    # hits: (projectile, ship) rows from CollisionSystem. Shields soak damage before health, the
+    # projectile is used up. Returns the ships that went down to 0 health.
+    killed = np.empty(hits.shape[0], dtype=np.int64)
+    n = 0
+    for k in range(hits.shape[0]):
+        p = hits[k, 0]
+        ship = hits[k, 1]
+        absorbed = min(shield[ship], damage[p])
+        shield[ship] -= absorbed
+        was_alive = health[ship] > 0
+        health[ship] -= damage[p] - absorbed
+        alive[p] = False
+        if was_alive and health[ship] <= 0:
+            killed[n] = ship
+            n += 1
+    return killed[:n]
+
+
+@numba.njit(cache=True)
+def expire(alive, kind, lifetime, count, dt):
+    # Ages projectiles, returns the slots whose lifetime ran out (they are marked dead already)
+    expired = np.empty(count, dtype=np.int64)
+    n = 0
+    for i in range(count):
+        if alive[i] and kind[i] == KIND_PROJECTILE:
+            lifetime[i] -= dt
+            if lifetime[i] <= 0:
+                alive[i] = False
+                expired[n] = i
+                n += 1
+    return expired[:n]
+
+
+class World:
+    # Entities as structure of arrays: slot i of every array belongs to the same entity. Slots past
+    # `count` were never used, freed slots go on a stack and are handed out again first, so spawn
+    # and despawn are O(1). Per-ship stats (from StatEngine) live in arrays too, the kernels above
+    # update every entity in one pass.
+    stat_columns = ("move_speed", "rotation_speed", "attack_speed", "damage", "projectile_speed", "heating",
+                    "overheat_duration", "shield_regeneration", "health_regeneration")
+
+    def __init__(self, capacity=1024, width=8192.0, height=8192.0):
+        self.capacity = capacity
+        self.width = width
+        self.height = height
+        self.count = 0
+        self.next_id = 1
+        self.free = np.zeros(capacity, dtype=np.int64)
+        self.free_count = 0
+        self.alive = np.zeros(capacity, dtype=np.bool_)
+        self.ids = np.zeros(capacity, dtype=np.uint32)
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        self.owner = np.zeros(capacity, dtype=np.int64)
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        # position before the last step, collision sweeps from here
+        self.previous = np.zeros((capacity, 2), dtype=np.float32)
+        self.radius = np.zeros(capacity, dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.angle = np.zeros(capacity, dtype=np.float32)
+        self.thrust = np.zeros(capacity, dtype=np.float32)
+        self.turn = np.zeros(capacity, dtype=np.float32)
+        self.shield = np.zeros(capacity, dtype=np.float32)
+        self.max_shield = np.zeros(capacity, dtype=np.float32)
+        self.health = np.zeros(capacity, dtype=np.float32)
+        self.max_health = np.zeros(capacity, dtype=np.float32)
+        self.heat = np.zeros(capacity, dtype=np.float32)
+        self.overheat = np.zeros(capacity, dtype=np.float32)
+        self.cooldown = np.zeros(capacity, dtype=np.float32)
+        self.lifetime = np.zeros(capacity, dtype=np.float32)
+        self.stats = {name: np.zeros(capacity, dtype=np.float32) for name in self.stat_columns}
+
+    def spawn(self, kind, x, y, angle=0.0, health=100.0, shield=0.0):
+        # Returns the slot, or -1 when the world is full
+        if self.free_count:
+            self.free_count -= 1
+            i = int(self.free[self.free_count])
+        elif self.count < self.capacity:
+            i = self.count
+            self.count += 1
+        else:
+            return -1
+        self.alive[i] = True
+        self.ids[i] = self.next_id
+        self.next_id += 1
+        self.kind[i] = kind
+        self.owner[i] = -1
+        self.position[i] = self.previous[i] = (x, y)
+        self.radius[i] = radii[kind]
+        self.velocity[i] = 0
+        self.angle[i] = angle
+        self.thrust[i] = 0
+        self.turn[i] = 0
+        self.health[i] = self.max_health[i] = health
+        self.shield[i] = self.max_shield[i] = shield
+        self.heat[i] = self.overheat[i] = self.cooldown[i] = self.lifetime[i] = 0
+        for column in self.stats.values():
+            column[i] = 0
+        return i
+
+    def spawn_ship(self, x, y, angle, stats):
+        # stats: a StatEngine.as_dict() of the ship's loadout, returns the slot or -1
+        i = self.spawn(KIND_SHIP, x, y, angle, stats["health"], stats["shield"])
+        if i < 0:
+            return i
+        for name in self.stat_columns:
+            self.stats[name][i] = stats[name]
+        return i
+
+    def despawn(self, i):
+        if self.alive[i]:
+            self.alive[i] = False
+            self.free[self.free_count] = i
+            self.free_count += 1
+
+    def release(self, slots):
+        # Slots already marked dead by a kernel
+        self.free[self.free_count:self.free_count + len(slots)] = slots
+        self.free_count += len(slots)
+
+    def respawn(self, i, x, y):
+        self.position[i] = self.previous[i] = (x, y)
+        self.health[i] = self.max_health[i]
+        self.shield[i] = self.max_shield[i]
+        self.heat[i] = self.overheat[i] = self.cooldown[i] = 0
+
+    def hit(self, hits):
+        # Applies projectile hits, returns the ships killed by them
+        killed = apply_damage(hits, self.stats["damage"], self.shield, self.health, self.alive)
+        self.release(hits[:, 0])
+        return killed
+
+    def active(self):
+        return np.flatnonzero(self.alive[:self.count])
+
+    def fire(self, i):
+        # Spawns a projectile from ship i if its weapon is ready, returns the slot or -1
+        if self.cooldown[i] > 0 or self.overheat[i] > 0:
+            return -1
+        angle = float(self.angle[i])
+        p = self.spawn(KIND_PROJECTILE, *self.position[i], angle, 1.0)
+        if p < 0:
+            return p
+        self.owner[p] = i
+        self.velocity[p] = (math.cos(angle) * self.stats["projectile_speed"][i],
+                            math.sin(angle) * self.stats["projectile_speed"][i])
+        self.stats["damage"][p] = self.stats["damage"][i]
+        self.lifetime[p] = projectile_lifetime
+        self.cooldown[i] = 1 / max(self.stats["attack_speed"][i], 1e-3)
+        self.heat[i] += heat_per_shot * self.stats["heating"][i]
+        if self.heat[i] >= 1:
+            self.heat[i] = 1
+            self.overheat[i] = self.stats["overheat_duration"][i]
+        return p
+
+    def step(self, dt):
+        n = self.count
+        steer(self.alive, self.kind, self.thrust, self.turn, self.angle, self.velocity, self.stats["move_speed"],
+              self.stats["rotation_speed"], n, dt)
+        self.previous[:n] = self.position[:n]
+        integrate(self.alive, self.position, self.velocity, n, dt, self.width, self.height)
+        update_heat(self.alive, self.heat, self.overheat, self.cooldown, n, dt)
+        regenerate(self.alive, self.shield, self.max_shield, self.stats["shield_regeneration"], self.health,
+                   self.max_health, self.stats["health_regeneration"], n, dt)
+        self.release(expire(self.alive, self.kind, self.lifetime, n, dt))
+
+    def records(self, indices):
+        # Wire records (net.entity_dtype) for the given slots, sorted by id as the delta encoder expects
+        indices = indices[np.argsort(self.ids[indices], kind="stable")]
+        records = np.empty(len(indices), dtype=entity_dtype)
+        records["id"] = self.ids[indices]
+        records["kind"] = self.kind[indices]
+        records["flags"] = self.overheat[indices] > 0
+        records["health"] = np.clip(self.health[indices] + self.shield[indices], 0, 65535)
+        records["x"] = self.position[indices, 0]
+        records["y"] = self.position[indices, 1]
+        records["angle"] = quantize_angle(self.angle[indices])
+        return records